@@ -0,0 +1,308 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import tornado.ioloop
+import tornado.web
+
+import dados_vendas
+from cache_vendas import cache
+
+# =============================
+# API HTTP/JSON (SOMENTE LEITURA)
+# =============================
+# Expõe os KPIs e agregados do dashboard em JSON, servida ao lado do Streamlit
+# e lendo o mesmo DataFrame em memória. Executada sozinha, lê as partições mensais
+# e carrega apenas os meses que cada consulta precisa.
+#
+#   GET /api/kpis?mes=2024-05&vendedor=Sarah
+#   GET /api/agregados/<mes|vendedor|equipe|categoria|servico|estado>?mes=2024-05
+#   GET /api/exportar/<csv|parquet>?vendedor=Sarah&inicio=2024-05-01&fim=2024-05-31
+#   GET /api/cache   (estatísticas do cache, para monitoramento)
+#
+# Filtros aceitos: mes, vendedor, equipe, categoria, servico, estado. A exportação aceita
+# também o intervalo de datas inicio/fim (inclusivas) e envia as linhas em blocos.
+# Os cálculos com pandas rodam em threads auxiliares para não travar o laço de eventos.
+PORTA_API = int(os.environ.get("API_VENDAS_PORTA", 8502))
+# A API não tem autenticação e a exportação entrega as vendas linha a linha (com clientes):
+# por padrão só aceita conexões locais. Para expor, use um proxy com autenticação/HTTPS
+# e informe em API_VENDAS_URL o endereço público usado nos links do dashboard.
+ENDERECO_API = os.environ.get("API_VENDAS_ENDERECO", "127.0.0.1")
+URL_PUBLICA_API = os.environ.get("API_VENDAS_URL")
+ENDERECOS_LOCAIS = ("127.0.0.1", "localhost", "::1")
+
+
+class EstadoApi:
+    def __init__(self):
+        self.dados = None
+        # Fonte com ler(meses): DadosEmMemoria ou ArmazemMensal
+        self.fonte = None
+        self.versao = 0
+
+    def publicar(self, dados):
+        if dados is self.dados:
+            return
+        self.dados = dados
+        if isinstance(dados, dados_vendas.ArmazemMensal):
+            self.fonte = dados
+        else:
+            self.fonte = dados_vendas.DadosEmMemoria(dados)
+        self.versao += 1
+        cache.limpar("api")
+
+
+estado = EstadoApi()
+
+
+def _json_padrao(valor):
+    if isinstance(valor, np.generic):
+        return valor.item()
+    if hasattr(valor, "isoformat"):
+        return valor.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+
+def _para_json(conteudo):
+    return json.dumps(conteudo, default=_json_padrao, ensure_ascii=False).encode("utf-8")
+
+
+async def _em_thread(funcao, *args):
+    return await tornado.ioloop.IOLoop.current().run_in_executor(None, funcao, *args)
+
+
+# =============================
+# HANDLERS
+# =============================
+class BaseHandler(tornado.web.RequestHandler):
+    def filtros(self):
+        filtros = {
+            nome: self.get_query_argument(nome)
+            for nome in dados_vendas.DIMENSOES
+            if self.get_query_argument(nome, None) not in dados_vendas.SEM_FILTRO
+        }
+        # `mes` é sempre um único mês AAAA-MM (trimestres e afins ficam para inicio/fim)
+        if "mes" in filtros:
+            try:
+                dados_vendas.periodo_mes(filtros["mes"])
+            except ValueError as erro:
+                raise tornado.web.HTTPError(400, reason=str(erro))
+        return filtros
+
+    async def responder(self, calcular):
+        if estado.fonte is None:
+            raise tornado.web.HTTPError(503, reason="Dados ainda não carregados")
+
+        consulta = tuple(sorted(
+            (nome, tuple(valores)) for nome, valores in self.request.query_arguments.items()
+        ))
+        # Respostas já serializadas: chave -> (corpo, etag)
+        chave = ("api", estado.versao, self.request.path, consulta)
+
+        def serializar():
+            corpo = _para_json(calcular(estado.fonte))
+            return corpo, '"%s"' % hashlib.sha1(corpo).hexdigest()
+
+        corpo, etag = await _em_thread(cache.obter_ou_calcular, chave, serializar)
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.set_header("Cache-Control", "no-cache")
+        self.set_header("Etag", etag)
+        if self.check_etag_header():
+            self.set_status(304)
+            self.finish()
+        else:
+            self.finish(corpo)
+
+
+class KpisHandler(BaseHandler):
+    async def get(self):
+        filtros = self.filtros()
+
+        def calcular(fonte):
+            # Com mês: lê só ele e o anterior
+            meses = None
+            if "mes" in filtros:
+                meses = [filtros["mes"], dados_vendas.mes_anterior(filtros["mes"])]
+            dados = fonte.ler(meses)
+
+            atual = dados_vendas.calcular_kpis(dados_vendas.filtrar(dados, **filtros))
+            variacao = None
+            if "mes" in filtros:
+                filtros_ant = dict(filtros, mes=meses[1])
+                anterior = dados_vendas.calcular_kpis(dados_vendas.filtrar(dados, **filtros_ant))
+                variacao = dados_vendas.variacao_kpis(atual, anterior)
+            return {"filtros": filtros, "kpis": atual, "variacao": variacao}
+
+        await self.responder(calcular)
+
+
+class AgregadosHandler(BaseHandler):
+    async def get(self, dimensao):
+        if dimensao not in dados_vendas.DIMENSOES:
+            raise tornado.web.HTTPError(404, reason=f"Dimensão desconhecida: {dimensao}")
+        filtros = self.filtros()
+
+        def calcular(fonte):
+            dados = fonte.ler([filtros["mes"]] if "mes" in filtros else None)
+            df_agg = dados_vendas.agregar(dados_vendas.filtrar(dados, **filtros), dimensao)
+            return {
+                "dimensao": dimensao,
+                "filtros": filtros,
+                "dados": df_agg.to_dict(orient="records"),
+            }
+
+        await self.responder(calcular)
+
+
+class ExportarHandler(BaseHandler):
+    async def get(self, formato):
+        if estado.fonte is None:
+            raise tornado.web.HTTPError(503, reason="Dados ainda não carregados")
+        if formato not in dados_vendas.FORMATOS_EXPORTACAO:
+            raise tornado.web.HTTPError(404, reason=f"Formato desconhecido: {formato}")
+
+        filtros = self.filtros()
+        try:
+            inicio, fim = (
+                None if valor in dados_vendas.SEM_FILTRO else pd.Timestamp(valor).normalize()
+                for valor in (self.get_query_argument("inicio", None), self.get_query_argument("fim", None))
+            )
+            periodo = dados_vendas.Periodo(inicio, fim, None, "Exportação")
+            pedacos = dados_vendas.exportar(estado.fonte, formato, periodo, **filtros)
+        except ValueError as erro:
+            raise tornado.web.HTTPError(400, reason=str(erro))
+        except ImportError:
+            raise tornado.web.HTTPError(501, reason="Exportação em Parquet requer pyarrow")
+
+        self.set_header("Content-Type", dados_vendas.FORMATOS_EXPORTACAO[formato])
+        self.set_header("Content-Disposition", f'attachment; filename="vendas.{formato}"')
+        self.set_header("Cache-Control", "no-store")
+        # Cada bloco é gerado numa thread auxiliar e enviado antes de o próximo ser gerado
+        while True:
+            pedaco = await _em_thread(next, pedacos, None)
+            if pedaco is None:
+                break
+            self.write(pedaco)
+            await self.flush()
+        self.finish()
+
+
+class CacheHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.set_header("Cache-Control", "no-store")
+        self.finish(_para_json(cache.estatisticas()))
+
+
+def criar_app():
+    return tornado.web.Application([
+        (r"/api/kpis", KpisHandler),
+        (r"/api/agregados/([a-z]+)", AgregadosHandler),
+        (r"/api/exportar/([a-z]+)", ExportarHandler),
+        (r"/api/cache", CacheHandler),
+    ])
+
+
+# =============================
+# INICIALIZAÇÃO
+# =============================
+# Se a porta estiver ocupada (outra instância, a API avulsa), a falha fica em `erro_servidor`
+# e uma nova tentativa só é feita depois deste intervalo
+INTERVALO_NOVA_TENTATIVA = 30
+
+_lock_servidor = threading.Lock()
+_thread_servidor = None
+_ultima_tentativa = 0.0
+erro_servidor = None
+
+
+async def _servir(porta, pronto=None):
+    global erro_servidor
+    try:
+        criar_app().listen(porta, address=ENDERECO_API)
+    except OSError as erro:
+        erro_servidor = erro
+        return
+    finally:
+        if pronto is not None:
+            pronto.set()
+    erro_servidor = None
+    await asyncio.Event().wait()
+
+
+def url_publica(host=None):
+    # Endereço base da API para o navegador de quem acessa o dashboard por `host`;
+    # None quando ela não é alcançável de lá (API local e acesso remoto, sem API_VENDAS_URL)
+    if URL_PUBLICA_API:
+        return URL_PUBLICA_API.rstrip("/")
+    host = host or "localhost"
+    if ENDERECO_API in ENDERECOS_LOCAIS:
+        if host not in ENDERECOS_LOCAIS:
+            return None
+        host = "localhost"
+    return f"http://{host}:{PORTA_API}"
+
+
+def api_ativa():
+    return _thread_servidor is not None and _thread_servidor.is_alive() and erro_servidor is None
+
+
+def iniciar_api(dados, porta=PORTA_API):
+    # Chamado a cada rerun do Streamlit: publica os dados e sobe o servidor uma única vez.
+    # Devolve se a API está no ar.
+    global _thread_servidor, _ultima_tentativa
+    estado.publicar(dados)
+    with _lock_servidor:
+        if _thread_servidor is None or (
+            not _thread_servidor.is_alive() and time.monotonic() - _ultima_tentativa >= INTERVALO_NOVA_TENTATIVA
+        ):
+            _ultima_tentativa = time.monotonic()
+            pronto = threading.Event()
+            _thread_servidor = threading.Thread(
+                target=asyncio.run, args=(_servir(porta, pronto),), name="api_vendas", daemon=True
+            )
+            _thread_servidor.start()
+            pronto.wait()
+    return api_ativa()
+
+
+# =============================
+# EXECUÇÃO AVULSA
+# =============================
+# Sozinha, a API confere periodicamente a versão dos dados e republica as partições
+# (regravadas a partir do CSV quando ele muda)
+INTERVALO_VERIFICACAO = 10
+
+
+def atualizar_fonte():
+    versao = dados_vendas.versao_dados()
+    if estado.fonte is not None and versao == cache.versao:
+        return
+    cache.definir_versao(versao)
+    if not dados_vendas.particoes_atualizadas():
+        # Prepara o CSV e regrava as partições; sem pyarrow, serve o DataFrame em memória
+        dados = dados_vendas.carregar_dados()
+        if not dados_vendas.particoes_atualizadas():
+            estado.publicar(dados)
+            return
+    estado.publicar(dados_vendas.ArmazemMensal())
+
+
+async def _verificar_fonte():
+    await _em_thread(atualizar_fonte)
+
+
+async def _servir_avulsa(porta):
+    atualizar_fonte()
+    tornado.ioloop.PeriodicCallback(_verificar_fonte, INTERVALO_VERIFICACAO * 1000).start()
+    await _servir(porta)
+
+
+if __name__ == "__main__":
+    asyncio.run(_servir_avulsa(PORTA_API))
+    if erro_servidor is not None:
+        raise SystemExit(f"API de vendas não iniciada: {erro_servidor}")
@@ -0,0 +1,217 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+
+# =============================
+# GERENCIADOR DE CACHE
+# =============================
+# Um único cache para resultados de filtros, agregados, figuras e modelos, com:
+#   - orçamento global em bytes e despejo LRU pelo tamanho de cada item;
+#   - validade atrelada à versão dos dados (trocar a versão invalida tudo) e TTL opcional;
+#   - contadores de acertos/faltas/despejos por categoria para monitoramento.
+# A categoria é o primeiro elemento da chave, ex.: ("agregado", "somas", "vendedor").
+LIMITE_CACHE_MB = int(os.environ.get("CACHE_VENDAS_MB", 512))
+# Por quanto tempo um cálculo em segundo plano que falhou fica no cache antes de ser refeito
+TTL_ERRO = 300
+
+Entrada = namedtuple("Entrada", ["valor", "tamanho", "versao", "expira"])
+
+def tamanho_em_bytes(valor):
+    # Estimativa do espaço ocupado em memória
+    if hasattr(valor, "tamanho_bytes"):
+        return valor.tamanho_bytes()
+    if isinstance(valor, (pd.DataFrame, pd.Series, pd.Index)):
+        # DataFrame devolve uma Series por coluna; Series e Index, um inteiro
+        return int(np.sum(valor.memory_usage(deep=True)))
+    if isinstance(valor, np.ndarray):
+        return valor.nbytes
+    if isinstance(valor, (bytes, bytearray, str)):
+        return sys.getsizeof(valor)
+    if isinstance(valor, (tuple, list, set, frozenset)):
+        return sys.getsizeof(valor) + sum(tamanho_em_bytes(v) for v in valor)
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(tamanho_em_bytes(k) + tamanho_em_bytes(v) for k, v in valor.items())
+    try:
+        return len(pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(valor)
+
+def _chave_argumento(valor):
+    # Converte argumentos não hashable (DataFrames, listas) numa chave estável
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        conteudo = pd.util.hash_pandas_object(valor, index=True).to_numpy().tobytes()
+        return ("pandas", valor.shape, hashlib.sha1(conteudo).hexdigest())
+    if isinstance(valor, (list, tuple)):
+        return tuple(_chave_argumento(v) for v in valor)
+    if isinstance(valor, dict):
+        return tuple(sorted((k, _chave_argumento(v)) for k, v in valor.items()))
+    return valor
+
+class GerenciadorCache:
+    def __init__(self, limite_bytes=LIMITE_CACHE_MB * 2**20, ttl=None, ttl_erro=TTL_ERRO):
+        self.limite_bytes = limite_bytes
+        self.ttl = ttl
+        self.ttl_erro = ttl_erro
+        self.versao = None
+        self.bytes = 0
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self._contadores = Counter()
+
+    # ----- versão dos dados -----
+    def definir_versao(self, versao):
+        # Itens calculados com outra versão dos dados deixam de valer e são liberados
+        with self._lock:
+            if versao == self.versao:
+                return
+            self.versao = versao
+            for chave in [c for c, e in self._itens.items() if e.versao != versao]:
+                self._remover(chave, "invalidacoes")
+
+    # ----- operações -----
+    def obter(self, chave, padrao=None):
+        categoria = chave[0]
+        with self._lock:
+            entrada = self._itens.get(chave)
+            if entrada is not None and entrada.versao == self.versao and \
+                    (entrada.expira is None or entrada.expira > time.monotonic()):
+                self._itens.move_to_end(chave)
+                self._contadores[("acertos", categoria)] += 1
+                return entrada.valor
+            if entrada is not None:
+                self._remover(chave, "expiracoes")
+            self._contadores[("faltas", categoria)] += 1
+            return padrao
+
+    def guardar(self, chave, valor, ttl=None, tamanho=None, versao=None):
+        categoria = chave[0]
+        tamanho = tamanho_em_bytes(valor) if tamanho is None else tamanho
+        ttl = self.ttl if ttl is None else ttl
+        expira = None if ttl is None else time.monotonic() + ttl
+
+        with self._lock:
+            if chave in self._itens:
+                self._remover(chave, None)
+            if versao is not None and versao != self.versao:
+                # Calculado com dados que já foram trocados
+                return valor
+            if tamanho > self.limite_bytes:
+                # Maior que o orçamento inteiro: não vale a pena despejar tudo por ele
+                self._contadores[("rejeitados", categoria)] += 1
+                return valor
+            self._liberar(tamanho)
+            self._itens[chave] = Entrada(valor, tamanho, self.versao, expira)
+            self.bytes += tamanho
+        if isinstance(valor, Future):
+            # Fora do lock: o callback roda na hora se o Future já terminou
+            valor.add_done_callback(lambda futuro: self._futuro_concluido(chave, futuro))
+        return valor
+
+    def _futuro_concluido(self, chave, futuro):
+        # Um cálculo em segundo plano que falhou fica no cache só por `ttl_erro` segundos: a falha é
+        # mostrada sem refazer o cálculo a cada rerun e, passado esse tempo, a próxima chamada tenta de novo.
+        # Se deu certo, o item passa a ocupar o tamanho do resultado (até aqui só o do Future).
+        falhou = futuro.cancelled() or futuro.exception() is not None
+        tamanho = None if falhou else tamanho_em_bytes(futuro.result())
+        with self._lock:
+            entrada = self._itens.get(chave)
+            if entrada is None or entrada.valor is not futuro:
+                return
+            if falhou:
+                self._contadores[("erros", chave[0])] += 1
+                expira = time.monotonic() + self.ttl_erro
+                if entrada.expira is None or expira < entrada.expira:
+                    self._itens[chave] = entrada._replace(expira=expira)
+                return
+            if tamanho > self.limite_bytes:
+                self._remover(chave, "rejeitados")
+                return
+            self.bytes += tamanho - entrada.tamanho
+            self._itens[chave] = entrada._replace(tamanho=tamanho)
+            self._liberar(0, exceto=chave)
+
+    def obter_ou_calcular(self, chave, calcular, ttl=None, medir=None):
+        # `medir`: função valor -> bytes, para objetos que tamanho_em_bytes não estima bem
+        ausente = object()
+        versao = self.versao
+        valor = self.obter(chave, ausente)
+        if valor is ausente:
+            valor = calcular()
+            tamanho = None if medir is None else medir(valor)
+            valor = self.guardar(chave, valor, ttl, tamanho, versao=versao)
+        return valor
+
+    def limpar(self, categoria=None):
+        with self._lock:
+            for chave in [c for c in self._itens if categoria is None or c[0] == categoria]:
+                self._remover(chave, None)
+
+    def _liberar(self, espaco, exceto=None):
+        # Despeja os itens usados há mais tempo até caberem mais `espaco` bytes
+        for chave in [c for c in self._itens if c != exceto]:
+            if self.bytes + espaco <= self.limite_bytes:
+                break
+            self._remover(chave, "despejos")
+
+    def _remover(self, chave, motivo):
+        entrada = self._itens.pop(chave)
+        self.bytes -= entrada.tamanho
+        if motivo:
+            self._contadores[(motivo, chave[0])] += 1
+
+    # ----- memorização de funções -----
+    def memorizar(self, categoria, ttl=None, medir=None):
+        # Como st.cache_resource: argumentos cujo nome começa com "_" ficam fora da chave
+        def decorador(funcao):
+            assinatura = inspect.signature(funcao)
+
+            @functools.wraps(funcao)
+            def envolvida(*args, **kwargs):
+                argumentos = assinatura.bind(*args, **kwargs)
+                argumentos.apply_defaults()
+                chave = (categoria, funcao.__qualname__) + tuple(
+                    (nome, _chave_argumento(valor))
+                    for nome, valor in argumentos.arguments.items()
+                    if not nome.startswith("_")
+                )
+                return self.obter_ou_calcular(chave, lambda: funcao(*args, **kwargs), ttl, medir)
+
+            return envolvida
+        return decorador
+
+    # ----- monitoramento -----
+    def estatisticas(self):
+        with self._lock:
+            por_categoria = {}
+            for (evento, categoria), total in self._contadores.items():
+                por_categoria.setdefault(categoria, Counter())[evento] += total
+            for chave, entrada in self._itens.items():
+                info = por_categoria.setdefault(chave[0], Counter())
+                info["itens"] += 1
+                info["bytes"] += entrada.tamanho
+
+            totais = Counter()
+            for info in por_categoria.values():
+                totais.update(info)
+            return {
+                "versao": self.versao,
+                "limite_bytes": self.limite_bytes,
+                "bytes": self.bytes,
+                "itens": len(self._itens),
+                **{evento: totais[evento] for evento in
+                   ("acertos", "faltas", "despejos", "expiracoes", "invalidacoes", "rejeitados", "erros")},
+                "categorias": {categoria: dict(info) for categoria, info in sorted(por_categoria.items())},
+            }
+
+# Instância compartilhada pelo dashboard, API e estruturas de dados
+cache = GerenciadorCache()
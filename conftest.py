@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import dados_vendas as dv
+
+# =============================
+# DADOS SINTÉTICOS
+# =============================
+# Dois anos de vendas com um mês inteiro sem vendas (2023-07) e membros que somem
+# em alguns meses, para exercitar as políticas de lacuna. Compartilhados por todos os módulos de teste.
+@pytest.fixture(scope="session")
+def dados():
+    sorteio = np.random.default_rng(7)
+    dias = pd.date_range("2023-01-01", "2024-12-31", freq="D")
+    dias = dias[dias.strftime("%Y-%m") != "2023-07"]
+    n = 4000
+    servicos = {"S1": "C1", "S2": "C1", "S3": "C2", "S4": "C2", "S5": "C3"}
+    servico = sorteio.choice(list(servicos), n)
+    df = pd.DataFrame({
+        "data_venda": sorteio.choice(dias, n),
+        "vendedor": sorteio.choice(["Ana", "Bia", "Caio", "Davi"], n),
+        "equipe": sorteio.choice(["E1", "E2"], n),
+        "servico": servico,
+        "categoria_servico": [servicos[s] for s in servico],
+        "estado": sorteio.choice(["SP", "RJ", "MG"], n),
+        "cliente": sorteio.choice([f"K{i}" for i in range(60)], n),
+        "quantidade": sorteio.integers(1, 10, n),
+        "preco_unitario": sorteio.uniform(10, 200, n).round(2),
+        "custo": sorteio.uniform(5, 500, n).round(2),
+    })
+    # Davi não vende no 1º trimestre de 2024 e S5 não é vendido em 2024-03
+    df = df[~((df["vendedor"] == "Davi") & df["data_venda"].between("2024-01-01", "2024-03-31"))]
+    df = df[~((df["servico"] == "S5") & (df["data_venda"].dt.strftime("%Y-%m") == "2024-03"))]
+    return dv.preparar_dados(df.reset_index(drop=True))
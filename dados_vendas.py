@@ -0,0 +1,666 @@
+import os
+import re
+import uuid
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from cache_vendas import cache
+
+# =============================
+# CARREGAMENTO DE DADOS
+# =============================
+ARQUIVO_DADOS = "relatorio_final.csv"
+# Dataset preparado, um arquivo Parquet por mês (ver ArmazemMensal)
+DIRETORIO_PARTICOES = "particoes"
+
+def versao_dados(caminho=ARQUIVO_DADOS, diretorio=DIRETORIO_PARTICOES):
+    # Identifica a versão da fonte (data de modificação do CSV, ou das partições sem CSV);
+    # os caches dependentes dos dados são invalidados quando ela muda
+    if os.path.exists(caminho):
+        return os.path.getmtime(caminho)
+    meses = _meses_particionados(diretorio)
+    return max((os.path.getmtime(_arquivo_particao(diretorio, mes)) for mes in meses), default=None)
+
+def preparar_dados(df):
+    df["data_venda"] = pd.to_datetime(df["data_venda"])
+    df["faturamento"] = df["quantidade"] * df["preco_unitario"]
+    df["lucro"] = df["faturamento"] - df["custo"]
+    df["mes"] = df["data_venda"].dt.to_period("M").astype(str)
+    df["dia"] = df["data_venda"].dt.date
+    # Ordenado por data: filtros de período viram um fatiamento por busca binária
+    return df.sort_values("data_venda", kind="stable").reset_index(drop=True)
+
+def carregar_dados(caminho=ARQUIVO_DADOS, diretorio=DIRETORIO_PARTICOES):
+    # Usa as partições mensais quando estão em dia com o CSV; senão prepara o CSV e as grava
+    try:
+        if particoes_atualizadas(caminho, diretorio):
+            return ArmazemMensal(diretorio).ler()
+        dados = preparar_dados(pd.read_csv(caminho))
+        particionar_dados(dados, diretorio)
+        return dados
+    except ImportError:
+        # Sem pyarrow não há Parquet: segue só com o CSV
+        return preparar_dados(pd.read_csv(caminho))
+
+# =============================
+# FILTROS
+# =============================
+# Nome do parâmetro -> coluna do dataset
+DIMENSOES = {
+    "mes": "mes",
+    "vendedor": "vendedor",
+    "equipe": "equipe",
+    "categoria": "categoria_servico",
+    "servico": "servico",
+    "estado": "estado",
+}
+
+METRICAS = ["faturamento", "lucro", "custo", "quantidade"]
+
+# Valores dos selectbox que significam "sem filtro"
+SEM_FILTRO = (None, "", "Todos", "Todas")
+
+def filtrar(dados, **filtros):
+    mascara = None
+    for nome, valor in filtros.items():
+        if valor in SEM_FILTRO:
+            continue
+        cond = dados[DIMENSOES[nome]] == valor
+        mascara = cond if mascara is None else mascara & cond
+    if mascara is None:
+        return dados
+    return dados[mascara]
+
+# =============================
+# KPIs E AGREGAÇÕES
+# =============================
+def calc_var(atual, anterior):
+    if anterior in (0, None):
+        return None
+    return (atual - anterior) / anterior * 100
+
+def kpis_de_totais(totais, clientes):
+    faturamento = totais["faturamento"]
+    lucro = totais["lucro"]
+    quantidade = totais["quantidade"]
+    vendas = totais["vendas"]
+
+    return {
+        "faturamento": faturamento,
+        "lucro": lucro,
+        "custo": totais["custo"],
+        "quantidade": quantidade,
+        "vendas": vendas,
+        "clientes": clientes,
+        "ticket": faturamento / quantidade if quantidade > 0 else 0,
+        "margem": (lucro / faturamento * 100) if faturamento > 0 else 0,
+        "media": faturamento / vendas if vendas > 0 else 0,
+        "venda_cliente": faturamento / clientes if clientes > 0 else 0,
+    }
+
+def calcular_kpis(df):
+    totais = {metrica: df[metrica].sum() for metrica in METRICAS}
+    totais["vendas"] = len(df)
+    return kpis_de_totais(totais, df["cliente"].nunique())
+
+def variacao_kpis(atual, anterior):
+    return {nome: calc_var(valor, anterior[nome]) for nome, valor in atual.items()}
+
+def mes_anterior(mes):
+    return (pd.Period(mes, "M") - 1).strftime("%Y-%m")
+
+def agregar(df, dimensao, metricas=METRICAS):
+    return df.groupby(DIMENSOES.get(dimensao, dimensao), as_index=False)[metricas].sum()
+
+# =============================
+# COMPARAÇÃO ENTRE PERÍODOS
+# =============================
+# Como tratar meses sem vendas ao buscar o "mês anterior":
+#   "calendario": mês imediatamente anterior do calendário (mês sem vendas conta como zero)
+#   "global": mês anterior dentre os meses com vendas no dataset (ou na lista `meses`)
+#   "ativo": último mês em que o próprio membro teve vendas; meses sem vendas do membro ficam de fora
+POLITICAS_LACUNA = ("calendario", "global", "ativo")
+
+METRICAS_COMPARACAO = [
+    "faturamento", "lucro", "custo", "quantidade", "vendas", "clientes",
+    "ticket", "margem", "media", "venda_cliente",
+]
+
+def _dividir(numerador, denominador, fator=1):
+    resultado = np.zeros_like(numerador, dtype=float)
+    np.divide(numerador * fator, denominador, out=resultado, where=denominador > 0)
+    return resultado
+
+def _anterior(valores, idx):
+    # Valor na linha `idx` de cada coluna; NaN quando não há período anterior (idx < 0)
+    alinhado = np.take_along_axis(valores, np.clip(idx, 0, None), axis=0).astype(float)
+    alinhado[idx < 0] = np.nan
+    return alinhado
+
+def _variacao(atual, anterior):
+    var = np.full(atual.shape, np.nan)
+    valido = ~np.isnan(anterior) & (anterior != 0)
+    var[valido] = (atual[valido] - anterior[valido]) / anterior[valido] * 100
+    return var
+
+def comparar_periodos(dados, dimensao=None, politica="calendario", meses=None):
+    # Variação mês a mês (MoM) e ano a ano (YoY) de todas as métricas, para todos os meses
+    # e todos os membros da dimensão de uma só vez. Retorna uma linha por (mes, membro) com
+    # as colunas <metrica>, <metrica>_ant, var_<metrica> e var_<metrica>_aa.
+    if politica not in POLITICAS_LACUNA:
+        raise ValueError(f"Política de lacuna desconhecida: {politica}")
+
+    coluna = DIMENSOES.get(dimensao, dimensao)
+    chaves = ["mes"] if coluna is None else ["mes", coluna]
+    grupos = dados.groupby(chaves).agg(
+        faturamento=("faturamento", "sum"),
+        lucro=("lucro", "sum"),
+        custo=("custo", "sum"),
+        quantidade=("quantidade", "sum"),
+        vendas=("faturamento", "size"),
+        clientes=("cliente", "nunique"),
+    )
+    if coluna is None:
+        grupos.index = pd.MultiIndex.from_arrays([grupos.index, ["Total"] * len(grupos)])
+
+    # ----- Eixo de meses -----
+    meses_dados = grupos.index.get_level_values(0).unique().sort_values()
+    if politica == "calendario":
+        eixo = pd.period_range(meses_dados.min(), meses_dados.max(), freq="M").strftime("%Y-%m")
+    elif politica == "global" and meses is not None:
+        eixo = pd.Index(sorted(meses))
+    else:
+        eixo = pd.Index(meses_dados)
+    membros = grupos.index.get_level_values(1).unique().sort_values()
+
+    # ----- Matrizes mes x membro -----
+    grade = pd.MultiIndex.from_product([eixo, membros])
+    completo = grupos.reindex(grade, fill_value=0)
+    forma = (len(eixo), len(membros))
+    valores = {m: completo[m].to_numpy().reshape(forma) for m in grupos.columns}
+    valores["ticket"] = _dividir(valores["faturamento"], valores["quantidade"])
+    valores["margem"] = _dividir(valores["lucro"], valores["faturamento"], 100)
+    valores["media"] = _dividir(valores["faturamento"], valores["vendas"])
+    valores["venda_cliente"] = _dividir(valores["faturamento"], valores["clientes"])
+
+    # ----- Índice do período anterior de cada célula -----
+    linhas = np.arange(len(eixo))[:, None]
+    ativo = valores["vendas"] > 0
+    if politica == "ativo":
+        ultimo_ativo = np.maximum.accumulate(np.where(ativo, linhas, -1), axis=0)
+        idx_ant = np.vstack([np.full((1, len(membros)), -1), ultimo_ativo[:-1]])
+    else:
+        idx_ant = np.broadcast_to(linhas - 1, forma)
+
+    # Mesmo mês do ano anterior, sempre pelo calendário
+    periodos = pd.PeriodIndex(eixo, freq="M")
+    idx_aa = eixo.get_indexer((periodos - 12).strftime("%Y-%m"))
+    idx_aa = np.broadcast_to(idx_aa[:, None], forma)
+
+    resultado = {"mes": np.repeat(eixo.to_numpy(), len(membros)),
+                 coluna or "membro": np.tile(membros.to_numpy(), len(eixo))}
+    for metrica in METRICAS_COMPARACAO:
+        atual = valores[metrica].astype(float)
+        anterior = _anterior(atual, idx_ant)
+        resultado[metrica] = atual.ravel()
+        resultado[f"{metrica}_ant"] = anterior.ravel()
+        resultado[f"var_{metrica}"] = _variacao(atual, anterior).ravel()
+        resultado[f"var_{metrica}_aa"] = _variacao(atual, _anterior(atual, idx_aa)).ravel()
+
+    tabela = pd.DataFrame(resultado)
+    if politica == "ativo":
+        tabela = tabela[ativo.ravel()].reset_index(drop=True)
+    return tabela
+
+def variacoes(tabela, mes, membro=None):
+    # Variações MoM de uma célula da tabela como dicionário (None quando não há comparação)
+    linhas = tabela[tabela["mes"] == mes]
+    if membro is not None:
+        linhas = linhas[linhas.iloc[:, 1] == membro]
+    if linhas.empty:
+        return {metrica: None for metrica in METRICAS_COMPARACAO}
+    linha = linhas.iloc[0]
+    return {
+        metrica: None if pd.isna(linha[f"var_{metrica}"]) else float(linha[f"var_{metrica}"])
+        for metrica in METRICAS_COMPARACAO
+    }
+
+def ranking_variacao(tabela, mes, metrica="faturamento", n=10, crescente=False, anual=False):
+    # Maiores altas (ou quedas, com crescente=True) de um mês
+    coluna_var = f"var_{metrica}_aa" if anual else f"var_{metrica}"
+    linhas = tabela.loc[tabela["mes"] == mes].dropna(subset=[coluna_var])
+    if crescente:
+        linhas = linhas.nsmallest(n, coluna_var)
+    else:
+        linhas = linhas.nlargest(n, coluna_var)
+    colunas = [tabela.columns[1], metrica] + ([] if anual else [f"{metrica}_ant"]) + [coluna_var]
+    return linhas[colunas]
+
+# =============================
+# PERÍODOS
+# =============================
+# inicio/fim são datas inclusivas (None = sem limite); mes só é preenchido para um mês único,
+# que é o caso em que existe comparação com o mês anterior.
+Periodo = namedtuple("Periodo", ["inicio", "fim", "mes", "rotulo"])
+
+PERIODO_TOTAL = Periodo(None, None, None, "Todos")
+
+def periodo_intervalo(inicio, fim):
+    inicio, fim = pd.Timestamp(inicio).normalize(), pd.Timestamp(fim).normalize()
+    return Periodo(inicio, fim, None, f"{inicio:%d/%m/%Y} a {fim:%d/%m/%Y}")
+
+def periodo_mes(mes):
+    # Um único mês "AAAA-MM"; qualquer outro texto (trimestre, "Ano até a data") é ValueError
+    if not isinstance(mes, str) or not re.fullmatch(r"\d{4}-\d{2}", mes):
+        raise ValueError(f"Mês inválido: {mes}")
+    periodo = pd.Period(mes, "M")
+    return Periodo(periodo.start_time, periodo.end_time.normalize(), mes, mes)
+
+def interpretar_periodo(opcao, ultima_data):
+    # "Todos", "Ano até a data", "2024-05" (mês) ou "2024-T2" (trimestre)
+    if opcao in SEM_FILTRO:
+        return PERIODO_TOTAL
+    if opcao == "Ano até a data":
+        ultima_data = pd.Timestamp(ultima_data).normalize()
+        return Periodo(ultima_data.replace(month=1, day=1), ultima_data, None, opcao)
+    if "-T" in opcao:
+        trimestre = pd.Period(opcao.replace("-T", "Q"), "Q")
+        return Periodo(trimestre.start_time, trimestre.end_time.normalize(), None, opcao)
+    return periodo_mes(opcao)
+
+def limites_periodo(dados, periodo):
+    # Posições [ini, fim) das linhas do período; requer `dados` ordenado por data_venda
+    datas = dados["data_venda"].to_numpy()
+    ini = 0 if periodo.inicio is None else np.searchsorted(datas, np.datetime64(periodo.inicio), "left")
+    fim = len(datas) if periodo.fim is None else np.searchsorted(
+        datas, np.datetime64(periodo.fim + pd.Timedelta(days=1)), "left"
+    )
+    return int(ini), int(fim)
+
+def fatiar_periodo(dados, periodo):
+    if periodo.inicio is None and periodo.fim is None:
+        return dados
+    ini, fim = limites_periodo(dados, periodo)
+    return dados.iloc[ini:fim]
+
+# =============================
+# SOMAS ACUMULADAS POR DIA
+# =============================
+METRICAS_ACUMULADAS = METRICAS + ["vendas"]
+
+class SomasAcumuladas:
+    # Soma acumulada de cada métrica aditiva, por membro da dimensão, guardada só nos dias
+    # em que o membro vendeu (layout esparso: memória proporcional às vendas, não a dias x membros).
+    # As células (membro, dia) ficam ordenadas numa só sequência; o total de qualquer intervalo
+    # é a diferença de duas linhas achadas por busca binária, sem varrer data_venda.
+    def __init__(self, dados, dimensao=None):
+        self.coluna = DIMENSOES.get(dimensao, dimensao)
+        dias = dados["data_venda"].dt.normalize()
+        self.inicio = dias.min()
+        self.n_dias = (dias.max() - self.inicio).days + 1
+        pos_dia = (dias - self.inicio).dt.days.to_numpy()
+
+        if self.coluna is None:
+            codigos, self.membros = np.zeros(len(dados), dtype=np.int64), pd.Index(["Total"])
+        else:
+            codigos, self.membros = pd.factorize(dados[self.coluna], sort=True)
+
+        # Chave da célula: membro * (n_dias + 1) + dia, crescente por membro e depois por dia
+        self.chaves, celula = np.unique(codigos.astype(np.int64) * (self.n_dias + 1) + pos_dia, return_inverse=True)
+        self.acumulado = np.zeros((len(self.chaves) + 1, len(METRICAS_ACUMULADAS)))
+        for j, metrica in enumerate(METRICAS_ACUMULADAS):
+            pesos = None if metrica == "vendas" else dados[metrica].to_numpy(dtype=float)
+            self.acumulado[1:, j] = np.cumsum(np.bincount(celula, weights=pesos, minlength=len(self.chaves)))
+
+    def tamanho_bytes(self):
+        return self.chaves.nbytes + self.acumulado.nbytes + int(self.membros.memory_usage(deep=True))
+
+    def _dias(self, periodo):
+        ini = 0 if periodo.inicio is None else (periodo.inicio - self.inicio).days
+        fim = self.n_dias if periodo.fim is None else (periodo.fim - self.inicio).days + 1
+        ini, fim = np.clip([ini, fim], 0, self.n_dias)
+        return ini, max(ini, fim)
+
+    def _diferenca(self, periodo, codigos):
+        # Totais do período para cada código de membro em `codigos`
+        ini, fim = self._dias(periodo)
+        base = codigos * (self.n_dias + 1)
+        linha_ini = np.searchsorted(self.chaves, base + ini)
+        linha_fim = np.searchsorted(self.chaves, base + fim)
+        return self.acumulado[linha_fim] - self.acumulado[linha_ini]
+
+    def total(self, periodo, membro=None):
+        if membro is not None and membro not in self.membros:
+            return dict.fromkeys(METRICAS_ACUMULADAS, 0.0)
+        pos = 0 if membro is None else self.membros.get_loc(membro)
+        return dict(zip(METRICAS_ACUMULADAS, self._diferenca(periodo, np.array([pos]))[0]))
+
+    def agregar(self, periodo):
+        # Equivalente a agregar(fatiar_periodo(dados, periodo), dimensao), em O(membros log vendas)
+        tabela = pd.DataFrame(self._diferenca(periodo, np.arange(len(self.membros))), columns=METRICAS_ACUMULADAS)
+        tabela.insert(0, self.coluna or "membro", self.membros)
+        return tabela[tabela["vendas"] > 0].reset_index(drop=True)
+
+# =============================
+# TOP-N E CAUDA LONGA
+# =============================
+ROTULO_OUTROS = "Outros"
+
+def top_n(tabela, coluna, valor="faturamento", n=15):
+    # Mantém os n maiores por `valor` e soma o restante numa linha "Outros".
+    # A seleção é parcial (argpartition): só os n escolhidos são ordenados.
+    if len(tabela) <= n:
+        return tabela.sort_values(valor, ascending=False, ignore_index=True)
+
+    valores = tabela[valor].to_numpy()
+    idx = np.argpartition(-valores, n - 1)[:n]
+    idx = idx[np.argsort(-valores[idx], kind="stable")]
+
+    resto = np.ones(len(tabela), dtype=bool)
+    resto[idx] = False
+    outros = tabela.loc[resto].select_dtypes("number").sum()
+    outros[coluna] = ROTULO_OUTROS
+
+    return pd.concat([tabela.iloc[idx], outros.to_frame().T], ignore_index=True).astype(tabela.dtypes.to_dict())
+
+def buscar_opcoes(opcoes, termo):
+    termo = (termo or "").strip().lower()
+    if not termo:
+        return list(opcoes)
+    return [opcao for opcao in opcoes if termo in str(opcao).lower()]
+
+# =============================
+# DRILL-DOWN POR ESTADO
+# =============================
+# estado -> vendedor/servico -> cliente. Cada estado é montado só quando pedido e as
+# consultas leem apenas as linhas daquele estado. Partições e consultas ficam no cache global.
+NIVEIS_DRILL = ("vendedor", "servico")
+
+class DrillDownEstados:
+    def __init__(self, dados):
+        self._dados = dados
+        # Posições das linhas de cada estado (em ordem de data, como em `dados`)
+        self._posicoes = dados.groupby("estado").indices
+
+    def tamanho_bytes(self):
+        # Só o índice por estado; as partições montadas são contadas no cache
+        return sum(posicoes.nbytes for posicoes in self._posicoes.values())
+
+    @property
+    def estados(self):
+        return sorted(self._posicoes)
+
+    def particao(self, estado):
+        if estado not in self._posicoes:
+            return self._dados.iloc[:0]
+        return cache.obter_ou_calcular(
+            ("filtro", "particao_estado", id(self), estado),
+            lambda: self._dados.iloc[self._posicoes[estado]]
+        )
+
+    def detalhar(self, estado, nivel="vendedor", membro=None, periodo=PERIODO_TOTAL):
+        # Sem `membro`: agregados do estado por vendedor/serviço.
+        # Com `membro`: clientes daquele vendedor/serviço dentro do estado.
+        if nivel not in NIVEIS_DRILL:
+            raise ValueError(f"Nível de drill-down desconhecido: {nivel}")
+        chave = ("agregado", "drill", id(self), estado, nivel, membro, periodo.inicio, periodo.fim)
+        return cache.obter_ou_calcular(chave, lambda: self._agregar(estado, nivel, membro, periodo))
+
+    def _agregar(self, estado, nivel, membro, periodo):
+        df = fatiar_periodo(self.particao(estado), periodo)
+        coluna = nivel
+        if membro is not None:
+            df = df[df[nivel] == membro]
+            coluna = "cliente"
+        return (
+            df.groupby(coluna, as_index=False)
+            .agg(
+                faturamento=("faturamento", "sum"),
+                lucro=("lucro", "sum"),
+                custo=("custo", "sum"),
+                quantidade=("quantidade", "sum"),
+                vendas=("faturamento", "size"),
+            )
+            .sort_values("faturamento", ascending=False, ignore_index=True)
+        )
+
+# =============================
+# PARTIÇÕES MENSAIS
+# =============================
+# Um arquivo "mes=AAAA-MM.parquet" por mês, já com as colunas calculadas em preparar_dados.
+# Quem precisa de um mês (e do anterior) lê só essas partições.
+def _arquivo_particao(diretorio, mes):
+    return os.path.join(diretorio, f"mes={mes}.parquet")
+
+def _meses_particionados(diretorio):
+    if not os.path.isdir(diretorio):
+        return []
+    return sorted(
+        nome[len("mes="):-len(".parquet")]
+        for nome in os.listdir(diretorio)
+        if nome.startswith("mes=") and nome.endswith(".parquet")
+    )
+
+def particoes_atualizadas(caminho=ARQUIVO_DADOS, diretorio=DIRETORIO_PARTICOES):
+    meses = _meses_particionados(diretorio)
+    if not meses:
+        return False
+    if not os.path.exists(caminho):
+        return True
+    gravacao = min(os.path.getmtime(_arquivo_particao(diretorio, mes)) for mes in meses)
+    return gravacao >= os.path.getmtime(caminho)
+
+def particionar_dados(dados, diretorio=DIRETORIO_PARTICOES):
+    os.makedirs(diretorio, exist_ok=True)
+    meses = sorted(dados["mes"].unique())
+    for mes in meses:
+        # Grava num temporário exclusivo e troca: leitores nunca veem arquivo parcial e dois
+        # processos regravando ao mesmo tempo (dashboard e API avulsa) não usam o mesmo temporário
+        destino = _arquivo_particao(diretorio, mes)
+        temporario = f"{destino}.{uuid.uuid4().hex}.tmp"
+        try:
+            fatiar_periodo(dados, periodo_mes(mes)).to_parquet(temporario, index=False)
+            os.replace(temporario, destino)
+        except Exception:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+    for mes in set(_meses_particionados(diretorio)) - set(meses):
+        try:
+            os.remove(_arquivo_particao(diretorio, mes))
+        except FileNotFoundError:
+            # Já removida por outro processo que regravou junto
+            pass
+
+def _concatenar(partes, vazio):
+    if not partes:
+        return vazio
+    return pd.concat(partes, ignore_index=True)
+
+class ArmazemMensal:
+    # Leitor das partições; os meses lidos recentemente ficam no cache global
+    def __init__(self, diretorio=DIRETORIO_PARTICOES):
+        self.diretorio = diretorio
+        self.meses = _meses_particionados(diretorio)
+
+    def _ler_particao(self, mes):
+        return pd.read_parquet(_arquivo_particao(self.diretorio, mes))
+
+    def ler(self, meses=None):
+        # Sem `meses`, lê o histórico inteiro sem passar pelo cache (que seria todo despejado)
+        if meses is None:
+            partes = [self._ler_particao(mes) for mes in self.meses]
+        else:
+            partes = [
+                cache.obter_ou_calcular(
+                    ("filtro", "particao_mes", os.path.abspath(self.diretorio), mes),
+                    lambda mes=mes: self._ler_particao(mes)
+                )
+                for mes in sorted(set(meses) & set(self.meses))
+            ]
+        return _concatenar(partes, self.vazio())
+
+    def vazio(self):
+        # DataFrame sem linhas com as colunas das partições, a partir só do esquema do arquivo
+        if not self.meses:
+            return pd.DataFrame()
+        import pyarrow.parquet as pq
+        return pq.read_schema(_arquivo_particao(self.diretorio, self.meses[0])).empty_table().to_pandas()
+
+    def blocos(self, periodo=PERIODO_TOTAL, tamanho_bloco=None, **filtros):
+        # Uma partição por vez e fora do cache (uma exportação grande o despejaria inteiro)
+        mes = filtros.get("mes")
+        for particao in self.meses:
+            if mes not in SEM_FILTRO and particao != mes:
+                continue
+            if periodo.inicio is not None and particao < f"{periodo.inicio:%Y-%m}":
+                continue
+            if periodo.fim is not None and particao > f"{periodo.fim:%Y-%m}":
+                continue
+            yield from blocos_filtrados(self._ler_particao(particao), periodo, tamanho_bloco, **filtros)
+
+class DadosEmMemoria:
+    # Mesma interface de leitura do ArmazemMensal sobre um DataFrame já carregado
+    def __init__(self, dados):
+        self.dados = dados
+        self.meses = sorted(dados["mes"].unique())
+        self.indice = IndiceFiltros(dados)
+
+    def ler(self, meses=None):
+        if meses is None:
+            return self.dados
+        # Meses desconhecidos (ou inválidos) são ignorados, como no ArmazemMensal
+        partes = [fatiar_periodo(self.dados, periodo_mes(mes)) for mes in sorted(set(meses) & set(self.meses))]
+        return _concatenar(partes, self.dados.iloc[:0])
+
+    def vazio(self):
+        return self.dados.iloc[:0]
+
+    def blocos(self, periodo=PERIODO_TOTAL, tamanho_bloco=None, **filtros):
+        return blocos_filtrados(self.dados, periodo, tamanho_bloco, self.indice, **filtros)
+
+# =============================
+# EXPORTAÇÃO EM BLOCOS
+# =============================
+# As linhas filtradas saem em blocos de até TAMANHO_BLOCO_EXPORTACAO linhas e cada bloco é
+# serializado e liberado antes do próximo: a memória não cresce com o tamanho da exportação.
+TAMANHO_BLOCO_EXPORTACAO = 50_000
+
+FORMATOS_EXPORTACAO = {
+    "csv": "text/csv; charset=UTF-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+class IndiceFiltros:
+    # Posições das linhas de cada membro, por dimensão (em ordem de data, como em `dados`).
+    # Cada dimensão é indexada na primeira consulta e fica no cache global.
+    def __init__(self, dados):
+        self._dados = dados
+
+    def posicoes(self, nome, valor):
+        indice = cache.obter_ou_calcular(
+            ("filtro", "indice", id(self), nome),
+            lambda: self._dados.groupby(DIMENSOES[nome]).indices
+        )
+        return indice.get(valor, np.empty(0, dtype=np.intp))
+
+def blocos_filtrados(dados, periodo=PERIODO_TOTAL, tamanho_bloco=None, indice=None, **filtros):
+    # Gera as linhas do período e dos filtros em blocos. O período (e o mês) vira um intervalo
+    # de posições por busca binária; com `indice`, o filtro mais seletivo dá as posições das
+    # linhas e os demais são aplicados bloco a bloco.
+    tamanho_bloco = tamanho_bloco or TAMANHO_BLOCO_EXPORTACAO
+    filtros = {nome: valor for nome, valor in filtros.items() if valor not in SEM_FILTRO}
+    ini, fim = limites_periodo(dados, periodo)
+    if "mes" in filtros:
+        ini_mes, fim_mes = limites_periodo(dados, periodo_mes(filtros.pop("mes")))
+        ini, fim = max(ini, ini_mes), min(fim, fim_mes)
+
+    if indice is None or not filtros:
+        for pos in range(ini, fim, tamanho_bloco):
+            bloco = filtrar(dados.iloc[pos:min(pos + tamanho_bloco, fim)], **filtros)
+            if len(bloco):
+                yield bloco
+        return
+
+    candidatas = {}
+    for nome, valor in filtros.items():
+        posicoes = indice.posicoes(nome, valor)
+        candidatas[nome] = posicoes[np.searchsorted(posicoes, ini):np.searchsorted(posicoes, fim)]
+    nome = min(candidatas, key=lambda n: len(candidatas[n]))
+    posicoes = candidatas[nome]
+    del filtros[nome]
+
+    for pos in range(0, len(posicoes), tamanho_bloco):
+        bloco = filtrar(dados.iloc[posicoes[pos:pos + tamanho_bloco]], **filtros)
+        if len(bloco):
+            yield bloco
+
+def _csv_em_blocos(blocos, vazio):
+    # `vazio`: função que devolve o DataFrame sem linhas, chamada só se nenhum bloco sair
+    cabecalho = True
+    for bloco in blocos:
+        yield bloco.to_csv(index=False, header=cabecalho).encode("utf-8")
+        cabecalho = False
+    if cabecalho:
+        yield vazio().to_csv(index=False).encode("utf-8")
+
+class _SaidaParcial:
+    # "Arquivo" do ParquetWriter que guarda só o que foi escrito desde a última coleta
+    def __init__(self):
+        self._partes = []
+        self._posicao = 0
+        self.closed = False
+
+    def write(self, conteudo):
+        self._partes.append(bytes(conteudo))
+        self._posicao += len(conteudo)
+        return len(conteudo)
+
+    def tell(self):
+        return self._posicao
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def coletar(self):
+        conteudo = b"".join(self._partes)
+        self._partes = []
+        return conteudo
+
+def _parquet_em_blocos(blocos, vazio):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Um row group por bloco; o esquema vem do primeiro bloco
+    saida = _SaidaParcial()
+    escritor = None
+    for bloco in blocos:
+        esquema = None if escritor is None else escritor.schema
+        tabela = pa.Table.from_pandas(bloco, schema=esquema, preserve_index=False)
+        if escritor is None:
+            escritor = pq.ParquetWriter(saida, tabela.schema)
+        escritor.write_table(tabela)
+        yield saida.coletar()
+    if escritor is None:
+        escritor = pq.ParquetWriter(saida, pa.Schema.from_pandas(vazio(), preserve_index=False))
+    escritor.close()
+    yield saida.coletar()
+
+def exportar(fonte, formato="csv", periodo=PERIODO_TOTAL, tamanho_bloco=None, **filtros):
+    # Gerador de pedaços de bytes do arquivo exportado; `fonte` é um DadosEmMemoria ou ArmazemMensal
+    if formato not in FORMATOS_EXPORTACAO:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+    if filtros.get("mes") not in SEM_FILTRO:
+        # `mes` é um único mês AAAA-MM nas duas fontes; validado aqui, antes do primeiro bloco
+        periodo_mes(filtros["mes"])
+    blocos = fonte.blocos(periodo, tamanho_bloco, **filtros)
+    if formato == "parquet":
+        # Sem pyarrow o erro aparece aqui, antes de qualquer byte ser enviado
+        import pyarrow.parquet  # noqa: F401
+        return _parquet_em_blocos(blocos, fonte.vazio)
+    return _csv_em_blocos(blocos, fonte.vazio)
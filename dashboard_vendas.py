@@ -1,8 +1,18 @@
+from urllib.parse import urlencode, urlsplit
+
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 import requests
 
+import api_vendas
+from cache_vendas import cache
+from dados_vendas import (
+    FORMATOS_EXPORTACAO, SEM_FILTRO, DrillDownEstados, SomasAcumuladas, carregar_dados, comparar_periodos,
+    fatiar_periodo, interpretar_periodo, buscar_opcoes, kpis_de_totais, periodo_intervalo, ranking_variacao,
+    top_n, variacoes, versao_dados,
+)
+
 # =============================
 # CONFIGURAÇÃO DA PÁGINA
 # =============================
@@ -12,25 +22,137 @@ st.markdown("<h1 style='text-align: center;'>Dashboard de Vendas</h1>", unsafe_a
 # =============================
 # CARREGAMENTO DE DADOS
 # =============================
-@st.cache_data
-def load_data():
-    df = pd.read_csv("relatorio_final.csv")
-    df["data_venda"] = pd.to_datetime(df["data_venda"])
-    df["faturamento"] = df["quantidade"] * df["preco_unitario"]
-    df["lucro"] = df["faturamento"] - df["custo"]
-    df["mes"] = df["data_venda"].dt.to_period("M").astype(str)
-    df["dia"] = df["data_venda"].dt.date
-    return df
-
-dados = load_data()
+@st.cache_resource(max_entries=1)
+def load_data(versao):
+    # Um único DataFrame compartilhado entre sessões e com a API; recarregado quando o CSV muda
+    return carregar_dados()
+
+# Tudo que está no cache e foi calculado sobre outra versão dos dados é descartado
+versao = versao_dados()
+cache.definir_versao(versao)
+dados = load_data(versao)
+api_no_ar = api_vendas.iniciar_api(dados)
+if not api_no_ar:
+    st.sidebar.warning(f"API de vendas fora do ar ({api_vendas.erro_servidor}); exportação indisponível.")
+
+# Membros exibidos nos gráficos de barras; o restante vira "Outros"
+TOP_N = 15
+# Acima disso os seletores ganham busca e paginação
+OPCOES_POR_PAGINA = 50
 
 # =============================
 # FUNÇÕES AUXILIARES
 # =============================
-def calc_var(atual, anterior):
-    if anterior == 0:
-        return None
-    return (atual - anterior) / anterior * 100
+@cache.memorizar("agregado")
+def comparacao(_dados, dimensao=None, politica="calendario"):
+    # Tabela de variações MoM/YoY de todos os meses e membros, calculada uma vez por dimensão
+    return comparar_periodos(_dados, dimensao, politica, meses=sorted(_dados["mes"].unique()))
+
+@cache.memorizar("agregado")
+def somas(_dados, dimensao=None):
+    # Somas acumuladas por dia: totais de qualquer período sem varrer as linhas
+    return SomasAcumuladas(_dados, dimensao)
+
+@cache.memorizar("agregado")
+def drilldown(_dados):
+    # Hierarquia estado -> vendedor/serviço -> cliente, montada por estado sob demanda
+    return DrillDownEstados(_dados)
+
+@cache.memorizar("filtro")
+def clientes_periodo(_dados, periodo, vendedor=None):
+    # Clientes distintos não saem das somas acumuladas: exige as linhas do período
+    df = fatiar_periodo(_dados, periodo)
+    if vendedor is not None:
+        df = df[df["vendedor"] == vendedor]
+    return df["cliente"].nunique()
+
+def seletor_periodo(rotulo, chave):
+    # Mês, trimestre, ano até a data ou intervalo livre; devolve um Periodo
+    meses = sorted(dados["mes"].unique())
+    trimestres = sorted({f"{m[:4]}-T{(int(m[5:]) - 1) // 3 + 1}" for m in meses})
+    opcoes = ["Todos", "Ano até a data", "Intervalo personalizado"] + meses + trimestres
+    escolha = st.selectbox(rotulo, opcoes, key=chave)
+
+    if escolha != "Intervalo personalizado":
+        return interpretar_periodo(escolha, dados["data_venda"].iloc[-1])
+
+    primeira, ultima = dados["data_venda"].iloc[0].date(), dados["data_venda"].iloc[-1].date()
+    intervalo = st.date_input(
+        "Intervalo",
+        value=(primeira, ultima),
+        min_value=primeira,
+        max_value=ultima,
+        format="DD/MM/YYYY",
+        key=f"{chave}_intervalo"
+    )
+    # Enquanto o usuário escolhe, o date_input devolve só a data inicial
+    inicio, fim = (tuple(intervalo) * 2)[:2] if intervalo else (primeira, ultima)
+    return periodo_intervalo(inicio, fim)
+
+def seletor_paginado(rotulo, opcoes, chave, multiplo=False, padrao=None, fixas=()):
+    # Selectbox/multiselect que, com muitas opções, mostra só uma página filtrada pela busca.
+    # `fixas` (ex.: "Todos") e os valores já selecionados ficam sempre disponíveis.
+    opcoes = list(opcoes)
+    if chave not in st.session_state and padrao is not None:
+        st.session_state[chave] = padrao
+    atual = st.session_state.get(chave)
+
+    # Seleções que saíram da lista (ex.: serviço de outra categoria, vendedor de outro estado)
+    # são descartadas; o seletor volta para `fixas[0]`/`padrao`, ou para a primeira opção
+    validas = set(fixas) | set(opcoes)
+    if multiplo:
+        selecionados = [valor for valor in (atual or []) if valor in validas]
+        if atual and not selecionados and padrao is not None:
+            selecionados = [valor for valor in padrao if valor in validas]
+        if selecionados != (atual or []):
+            st.session_state[chave] = selecionados
+    elif atual is None or atual in validas:
+        selecionados = [] if atual is None else [atual]
+    else:
+        reserva = fixas[0] if fixas else padrao
+        if reserva in validas:
+            st.session_state[chave] = reserva
+            selecionados = [reserva]
+        else:
+            del st.session_state[chave]
+            selecionados = []
+
+    if len(opcoes) > OPCOES_POR_PAGINA:
+        encontradas = buscar_opcoes(opcoes, st.text_input(f"Buscar {rotulo.lower()}", key=f"{chave}_busca"))
+        paginas = max(1, -(-len(encontradas) // OPCOES_POR_PAGINA))
+        pagina = 1
+        if paginas > 1:
+            pagina = st.number_input(f"Página (de {paginas})", 1, paginas, 1, key=f"{chave}_pagina")
+        opcoes = encontradas[(pagina - 1) * OPCOES_POR_PAGINA:pagina * OPCOES_POR_PAGINA]
+
+    # Mantém selecionados que estejam fora da página atual
+    opcoes = list(dict.fromkeys([*fixas, *selecionados, *opcoes]))
+
+    if multiplo:
+        return st.multiselect(rotulo, opcoes, key=chave)
+    return st.selectbox(rotulo, opcoes, key=chave)
+
+def botoes_exportacao(periodo, **filtros):
+    # Links para a API, que envia as linhas em blocos; um download_button exigiria
+    # o arquivo inteiro em memória a cada rerun. Sem a API no ar, os links não são exibidos.
+    if not api_no_ar:
+        st.caption("Exportação indisponível: a API de vendas não está no ar.")
+        return
+    base = api_vendas.url_publica(urlsplit("//" + st.context.headers.get("Host", "localhost")).hostname)
+    if base is None:
+        st.caption("Exportação disponível só no servidor; para acesso remoto configure API_VENDAS_URL.")
+        return
+    consulta = {nome: valor for nome, valor in filtros.items() if valor not in SEM_FILTRO}
+    if periodo.inicio is not None:
+        consulta["inicio"] = f"{periodo.inicio:%Y-%m-%d}"
+    if periodo.fim is not None:
+        consulta["fim"] = f"{periodo.fim:%Y-%m-%d}"
+
+    colunas = st.columns([1] * len(FORMATOS_EXPORTACAO) + [6])
+    for coluna, formato in zip(colunas, FORMATOS_EXPORTACAO):
+        with coluna:
+            url = f"{base}/api/exportar/{formato}?{urlencode(consulta)}"
+            st.link_button(f"Baixar {formato.upper()}", url)
 
 def kpi_box(titulo, valor, variacao=None, formato="R$ {:,.2f}", unidade=""):
     st.markdown(f"**{titulo}**")
@@ -57,48 +179,28 @@ tab1, tab2, tab3, tab4, tab5 = st.tabs(["Visão Geral", "Vendedores & Equipes",
 # =============================
 with tab1:
 
-    # ===== FILTRO DE MÊS =====
-    meses = ["Todos"] + sorted(dados["mes"].unique())
+    # ===== FILTRO DE PERÍODO =====
     col_filtro, _ = st.columns([1, 4])
     with col_filtro:
-        mes_selecionado = st.selectbox("Mês", meses)
+        periodo = seletor_periodo("Período", "filtro_periodo_tab1")
+    mes_selecionado = periodo.mes
 
     # ===== FILTRAGEM DE DADOS =====
-    if mes_selecionado == "Todos":
-        df_atual = dados.copy()
-    else:
-        df_atual = dados[dados["mes"] == mes_selecionado]
+    df_atual = fatiar_periodo(dados, periodo)
 
     # ===== CÁLCULO DAS MÉTRICAS =====
-    faturamento = df_atual["faturamento"].sum()
-    lucro = df_atual["lucro"].sum()
-    quantidade = df_atual["quantidade"].sum()
-    ticket = faturamento / quantidade if quantidade > 0 else 0
-    margem = (lucro / faturamento * 100) if faturamento > 0 else 0
-
-    custo = df_atual["custo"].sum()
-    clientes = df_atual["cliente"].nunique()
-    venda_cliente = faturamento / clientes if clientes > 0 else 0
+    kpis = kpis_de_totais(somas(dados).total(periodo), clientes_periodo(dados, periodo))
+    faturamento, lucro, quantidade = kpis["faturamento"], kpis["lucro"], kpis["quantidade"]
+    ticket, margem, custo = kpis["ticket"], kpis["margem"], kpis["custo"]
+    clientes, venda_cliente = kpis["clientes"], kpis["venda_cliente"]
 
     # ===== VARIAÇÃO MÊS ANTERIOR =====
-    if mes_selecionado != "Todos":
-        mes_dt = pd.to_datetime(mes_selecionado + "-01")
-        mes_ant = (mes_dt - pd.DateOffset(months=1)).strftime("%Y-%m")
-        df_ant = dados[dados["mes"] == mes_ant]
-
-        var_fat = calc_var(faturamento, df_ant["faturamento"].sum())
-        var_lucro = calc_var(lucro, df_ant["lucro"].sum())
-        var_qtd = calc_var(quantidade, df_ant["quantidade"].sum())
-
-        ticket_ant = (df_ant["faturamento"].sum() / df_ant["quantidade"].sum()) if df_ant["quantidade"].sum() > 0 else 0
-        margem_ant = (df_ant["lucro"].sum() / df_ant["faturamento"].sum() * 100) if df_ant["faturamento"].sum() > 0 else 0
-        var_ticket = calc_var(ticket, ticket_ant)
-        var_margem = calc_var(margem, margem_ant)
-
-        var_custo = calc_var(custo, df_ant["custo"].sum())
-        var_clientes = calc_var(clientes, df_ant["cliente"].nunique())
-        venda_cliente_ant = (df_ant["faturamento"].sum() / df_ant["cliente"].nunique()) if df_ant["cliente"].nunique() > 0 else 0
-        var_venda_cliente = calc_var(venda_cliente, venda_cliente_ant)
+    if mes_selecionado is not None:
+        var = variacoes(comparacao(dados), mes_selecionado)
+
+        var_fat, var_lucro, var_qtd = var["faturamento"], var["lucro"], var["quantidade"]
+        var_ticket, var_margem = var["ticket"], var["margem"]
+        var_custo, var_clientes, var_venda_cliente = var["custo"], var["clientes"], var["venda_cliente"]
     else:
         var_fat = var_lucro = var_qtd = var_ticket = var_margem = None
         var_custo = var_clientes = var_venda_cliente = None
@@ -124,13 +226,13 @@ with tab1:
         kpi_box("Venda Média por Cliente", venda_cliente, var_venda_cliente)
 
     with col_graf:
-        if mes_selecionado == "Todos":
+        if periodo.inicio is None:
             df_plot = dados.groupby("mes", as_index=False)["faturamento"].sum()
             fig = px.line(df_plot, x="mes", y="faturamento", markers=True, title="Faturamento Mensal")
             fig.update_layout(template="plotly_dark", yaxis_title="R$", height=500)
         else:
             df_plot = df_atual.groupby("dia", as_index=False)["faturamento"].sum()
-            fig = px.line(df_plot, x="dia", y="faturamento", markers=True, title=f"Faturamento Diário - {mes_selecionado}")
+            fig = px.line(df_plot, x="dia", y="faturamento", markers=True, title=f"Faturamento Diário - {periodo.rotulo}")
             fig.update_xaxes(tickformat="%d/%m")
             fig.update_layout(template="plotly_dark", yaxis_title="R$", height=650)
 
@@ -146,12 +248,6 @@ with tab2:
     # =========================
     # Funções auxiliares
     # =========================
-    def calc_var(atual, anterior):
-        if anterior in (0, None):
-            return None
-        return ((atual - anterior) / anterior) * 100
-
-
     def texto_kpi(valor, variacao=None, formato="R$ {:,.2f}", unidade=""):
         try:
             texto_valor = formato.format(float(valor))
@@ -180,70 +276,33 @@ with tab2:
     # Filtros
     # =========================
     vendedores = sorted(dados["vendedor"].unique())
-    meses = sorted(dados["mes"].unique())
-    meses_disponiveis = ["Todos"] + meses
 
     col_vend, col_mes, _ = st.columns([1, 1, 2])
 
     with col_vend:
-        vend = st.selectbox("Vendedor", vendedores)
+        vend = seletor_paginado("Vendedor", vendedores, "filtro_vendedor")
 
     with col_mes:
-        mes_sel = st.selectbox("Mês", meses_disponiveis, key="filtro_mesv")
-
-    # =========================
-    # Dados filtrados
-    # =========================
-    df_ven = dados[dados["vendedor"] == vend]
-
-    if mes_sel != "Todos":
-        df_ven = df_ven[df_ven["mes"] == mes_sel]
+        periodo = seletor_periodo("Período", "filtro_mesv")
+    mes_sel = periodo.mes
 
     # =========================
     # KPIs atuais
     # =========================
-    fat = df_ven["faturamento"].sum()
-    lucro = df_ven["lucro"].sum()
-    qtd = df_ven["quantidade"].sum()
-    clientes = df_ven["cliente"].nunique()
-
-    media = fat / len(df_ven) if len(df_ven) > 0 else 0
-    margem = (lucro / fat * 100) if fat > 0 else 0
+    kpis = kpis_de_totais(somas(dados, "vendedor").total(periodo, vend), clientes_periodo(dados, periodo, vend))
+    fat, lucro, qtd = kpis["faturamento"], kpis["lucro"], kpis["quantidade"]
+    clientes, media, margem = kpis["clientes"], kpis["media"], kpis["margem"]
 
     # =========================
     # KPIs mês anterior
     # =========================
+    # Compara com o último mês em que o vendedor teve vendas
     var_fat = var_lucro = var_qtd = var_media = var_margem = var_clientes = None
 
-    if mes_sel != "Todos":
-        meses_vendedor = sorted(
-            dados[dados["vendedor"] == vend]["mes"].unique()
-        )
-
-        if mes_sel in meses_vendedor:
-            idx = meses_vendedor.index(mes_sel)
-
-            if idx > 0:
-                mes_ant = meses_vendedor[idx - 1]
-                df_ant = dados[
-                    (dados["vendedor"] == vend) &
-                    (dados["mes"] == mes_ant)
-                ]
-
-                fat_ant = df_ant["faturamento"].sum()
-                lucro_ant = df_ant["lucro"].sum()
-                qtd_ant = df_ant["quantidade"].sum()
-                clientes_ant = df_ant["cliente"].nunique()
-
-                media_ant = fat_ant / len(df_ant) if len(df_ant) > 0 else 0
-                margem_ant = (lucro_ant / fat_ant * 100) if fat_ant > 0 else 0
-
-                var_fat = calc_var(fat, fat_ant)
-                var_lucro = calc_var(lucro, lucro_ant)
-                var_qtd = calc_var(qtd, qtd_ant)
-                var_media = calc_var(media, media_ant)
-                var_margem = calc_var(margem, margem_ant)
-                var_clientes = calc_var(clientes, clientes_ant)
+    if mes_sel is not None:
+        var = variacoes(comparacao(dados, "vendedor", "ativo"), mes_sel, vend)
+        var_fat, var_lucro, var_qtd = var["faturamento"], var["lucro"], var["quantidade"]
+        var_media, var_margem, var_clientes = var["media"], var["margem"], var["clientes"]
 
     # =========================
     # Exibição dos KPIs
@@ -268,25 +327,40 @@ with tab2:
     with col6:
         kpi_box("Total de Clientes", texto_kpi(clientes, var_clientes, "{:,.0f}", "Un"))
 
+    # Vendas do vendedor no período
+    botoes_exportacao(periodo, vendedor=vend)
+
+    # =========================
+    # Ranking de variação do mês
+    # =========================
+    if mes_sel is not None:
+        tabela_vend = comparacao(dados, "vendedor", "ativo")
+        colunas_rank = {
+            "vendedor": "Vendedor",
+            "faturamento": "Faturamento",
+            "faturamento_ant": "Mês anterior",
+            "var_faturamento": "Variação (%)",
+        }
+        col_alta, col_queda = st.columns(2)
+        with col_alta:
+            st.markdown("**Maiores altas no mês**")
+            st.dataframe(ranking_variacao(tabela_vend, mes_sel, n=5).rename(columns=colunas_rank), hide_index=True)
+        with col_queda:
+            st.markdown("**Maiores quedas no mês**")
+            st.dataframe(ranking_variacao(tabela_vend, mes_sel, n=5, crescente=True).rename(columns=colunas_rank), hide_index=True)
 
     st.divider()
 
-    vend = dados["vendedor"].unique()
-    meses_fat = ["Todos"] + sorted(dados["mes"].unique())
     mul_filtro,_,filtro_meses, _ = st.columns([1,1,1,1])
     with mul_filtro:
-        vends = st.multiselect("Vendedor", vend, default=["Sarah"])
+        vends = seletor_paginado("Vendedor", vendedores, "filtro_vendedores", multiplo=True, padrao=["Sarah"])
         if vends:
             df_filtrado = dados[dados["vendedor"].isin(vends)]
         else:
             df_filtrado = dados[dados["vendedor"] == 'Sarah']
 
     with filtro_meses:
-        mes_sel = st.selectbox("Mês", meses_disponiveis, key="filtro_bar")
-    if mes_sel != "Todos":
-        df_bar = dados[dados['mes'] == mes_sel]
-    else:
-        df_bar = dados.copy()
+        periodo_bar = seletor_periodo("Período", "filtro_bar")
     col1, col2 = st.columns(2)
     with col1: 
         df_agg = (
@@ -311,7 +385,7 @@ with tab2:
         st.plotly_chart(fig, use_container_width=True)
 
     with col2:
-        df_agg = df_bar.groupby(['vendedor'], as_index=False)['faturamento'].sum()
+        df_agg = top_n(somas(dados, "vendedor").agregar(periodo_bar), "vendedor", n=TOP_N)
         long_df = px.data.medals_long()
 
             # Gráfico de barras
@@ -319,7 +393,7 @@ with tab2:
             df_agg,
             x="vendedor",
             y="faturamento",
-            title="Faturamento por vendedor",
+            title=f"Faturamento por vendedor (top {TOP_N})",
             text_auto=".2f"
         )
 
@@ -337,16 +411,9 @@ with tab2:
 
         st.plotly_chart(figb, use_container_width=True)
 
-    meses_e = ["Todos"] + sorted(dados["mes"].unique())
     _,_,filtro, _ = st.columns([1,1,1,1])
     with filtro:
-        mes_sel = st.selectbox("Mês", meses_e, key="filtro_mes")
-
-
-    if mes_sel == "Todos":
-        df_new = dados.copy()
-    else:
-        df_new = dados[dados["mes"] == mes_sel]
+        periodo_equipe = seletor_periodo("Período", "filtro_mes")
 
     col1, col2 = st.columns(2)
     with col1:
@@ -370,7 +437,7 @@ with tab2:
         )
         st.plotly_chart(fig, use_container_width=True)
     with col2:
-        df_equipe = df_new.groupby(['equipe'], as_index=False)['faturamento'].sum()
+        df_equipe = somas(dados, "equipe").agregar(periodo_equipe)
         equi_df = px.data.medals_long()
 
         figb = px.bar(
@@ -405,12 +472,6 @@ with tab3:
     # =========================
     # Funções auxiliares
     # =========================
-    def calc_var(atual, anterior):
-        if anterior in (0, None):
-            return None
-        return ((atual - anterior) / anterior) * 100
-
-
     def texto_kpi(valor, variacao=None, formato="R$ {:,.2f}", unidade=""):
         try:
             texto_valor = formato.format(float(valor))
@@ -438,13 +499,13 @@ with tab3:
     # =========================
     # Filtros
     # =========================
-    meses = ["Todos"] + sorted(dados["mes"].unique())
     categorias = ["Todas"] + sorted(dados["categoria_servico"].unique())
 
     col_mes, col_cat, col_serv = st.columns(3)
 
     with col_mes:
-        mes_sel = st.selectbox("Mês", meses, key="filtro_mes_tab3")
+        periodo = seletor_periodo("Período", "filtro_mes_tab3")
+    mes_sel = periodo.mes
 
     with col_cat:
         categoria_sel = st.selectbox("Categoria", categorias, key="filtro_cat_tab3")
@@ -458,25 +519,22 @@ with tab3:
         )
 
     with col_serv:
-        servico_sel = st.selectbox("Serviço", servicos, key="filtro_serv_tab3")
+        servico_sel = seletor_paginado("Serviço", servicos[1:], "filtro_serv_tab3", fixas=["Todos"])
 
     # =========================
     # Dados atuais
     # =========================
-    df_atual = dados.copy()
-
-    if mes_sel != "Todos":
-        df_atual = df_atual[df_atual["mes"] == mes_sel]
-
-    if categoria_sel != "Todas":
-        df_atual = df_atual[df_atual["categoria_servico"] == categoria_sel]
-
+    # O serviço pertence à categoria, então basta o filtro mais específico
     if servico_sel != "Todos":
-        df_atual = df_atual[df_atual["servico"] == servico_sel]
+        totais = somas(dados, "servico").total(periodo, servico_sel)
+    elif categoria_sel != "Todas":
+        totais = somas(dados, "categoria").total(periodo, categoria_sel)
+    else:
+        totais = somas(dados).total(periodo)
 
-    faturamento = df_atual["faturamento"].sum()
-    lucro = df_atual["lucro"].sum()
-    quantidade = df_atual["quantidade"].sum()
+    faturamento = totais["faturamento"]
+    lucro = totais["lucro"]
+    quantidade = totais["quantidade"]
 
     ticket = faturamento / quantidade if quantidade > 0 else 0
     margem = (lucro / faturamento * 100) if faturamento > 0 else 0
@@ -484,37 +542,19 @@ with tab3:
 
     # Dados mês anterior
     # =========================
+    # Compara com o mês anterior dentre os meses com vendas no dataset
     var_fat = var_lucro = var_qtd = var_ticket = var_margem = None
 
-    if mes_sel != "Todos":
-        meses_ord = sorted(dados["mes"].unique())
-
-        if mes_sel in meses_ord:
-            idx = meses_ord.index(mes_sel)
-
-            if idx > 0:
-                mes_ant = meses_ord[idx - 1]
-
-                df_ant = dados[dados["mes"] == mes_ant]
-
-                if categoria_sel != "Todas":
-                    df_ant = df_ant[df_ant["categoria_servico"] == categoria_sel]
-
-                if servico_sel != "Todos":
-                    df_ant = df_ant[df_ant["servico"] == servico_sel]
-
-                faturamento_ant = df_ant["faturamento"].sum()
-                lucro_ant = df_ant["lucro"].sum()
-                quantidade_ant = df_ant["quantidade"].sum()
-
-                ticket_ant = faturamento_ant / quantidade_ant if quantidade_ant > 0 else 0
-                margem_ant = (lucro_ant / faturamento_ant * 100) if faturamento_ant > 0 else 0
+    if mes_sel is not None:
+        if servico_sel != "Todos":
+            var = variacoes(comparacao(dados, "servico", "global"), mes_sel, servico_sel)
+        elif categoria_sel != "Todas":
+            var = variacoes(comparacao(dados, "categoria", "global"), mes_sel, categoria_sel)
+        else:
+            var = variacoes(comparacao(dados, politica="global"), mes_sel)
 
-                var_fat = calc_var(faturamento, faturamento_ant)
-                var_lucro = calc_var(lucro, lucro_ant)
-                var_qtd = calc_var(quantidade, quantidade_ant)
-                var_ticket = calc_var(ticket, ticket_ant)
-                var_margem = calc_var(margem, margem_ant)
+        var_fat, var_lucro, var_qtd = var["faturamento"], var["lucro"], var["quantidade"]
+        var_ticket, var_margem = var["ticket"], var["margem"]
 
     # =========================
     # Exibição dos KPIs
@@ -536,26 +576,18 @@ with tab3:
     with col5:
         kpi_box("Margem de Lucro", texto_kpi(margem, var_margem, "{:.2f}", "%"))
 
-    st.divider()
+    # Vendas do serviço (ou da categoria) no período
+    botoes_exportacao(periodo, categoria=categoria_sel, servico=servico_sel)
 
-    # =========================
-    # Lista de meses
-    # =========================
-    mesest3 = ["Todos"] + sorted(dados["mes"].unique())
+    st.divider()
 
     # =========================
-    # Filtro de mês
+    # Filtro de período
     # =========================
     _,col_mesb, _ = st.columns([2,1,1])
 
     with col_mesb:
-        mes_sel_bar = st.selectbox("Mês", mesest3, key="filtro_mes_tab_bar")
-
-    # DataFrame filtrado pelo mês
-    if mes_sel_bar != "Todos":
-        df_bar = dados[dados["mes"] == mes_sel_bar]
-    else:
-        df_bar = dados.copy()
+        periodo_bar = seletor_periodo("Período", "filtro_mes_tab_bar")
 
     col1g, col2g = st.columns(2)
     with col1g:
@@ -578,13 +610,10 @@ with tab3:
             legend_title="categoria_servico"
         )
         st.plotly_chart(fig, use_container_width=True)
-    
-        df_equipe = df_new.groupby(['equipe'], as_index=False)['faturamento'].sum()
-        equi_df = px.data.medals_long()
 
     with col2g:
 
-        df_equipe = df_bar.groupby(['categoria_servico'], as_index=False)['faturamento'].sum()
+        df_equipe = somas(dados, "categoria").agregar(periodo_bar)
         equi_df = px.data.medals_long()
 
         figb = px.bar(
@@ -609,7 +638,6 @@ with tab3:
 
         st.plotly_chart(figb, use_container_width=True)
 
-    lista_meses = ["Todos"] + sorted(dados["mes"].unique())
     lista_servicos = sorted(dados["servico"].unique())
 
     # =========================
@@ -619,11 +647,12 @@ with tab3:
 
     # 🔹 Filtro de serviço (para o gráfico de linha)
     with col_serv:
-        servicos_sel = st.multiselect(
+        servicos_sel = seletor_paginado(
             "Serviço",
             lista_servicos,
-            default=["Backup em Nuvem"],
-            key="mult2"
+            "mult2",
+            multiplo=True,
+            padrao=["Backup em Nuvem"]
         )
 
         if servicos_sel:
@@ -631,14 +660,9 @@ with tab3:
         else:
             df_servico = dados[dados["servico"] == "Backup em Nuvem"]
 
-    # 🔹 Filtro de mês (para o gráfico de barras)
+    # 🔹 Filtro de período (para o gráfico de barras)
     with col_mes:
-        mes_sel_l3 = st.selectbox("Mês", lista_meses, key="filtro_mes_tab_bars")
-
-        if mes_sel_l3 != "Todos":
-            df_mes = dados[dados["mes"] == mes_sel_l3]
-        else:
-            df_mes = dados.copy()
+        periodo_servico = seletor_periodo("Período", "filtro_mes_tab_bars")
 
     # =========================
     # Layout dos gráficos
@@ -676,17 +700,13 @@ with tab3:
     # GRÁFICO 2 — Barras (por mês)
     # =========================
     with colgr2:
-        df_bar = (
-            df_mes
-            .groupby("servico", as_index=False)["faturamento"]
-            .sum()
-        )
+        df_bar = top_n(somas(dados, "servico").agregar(periodo_servico), "servico", n=TOP_N)
 
         fig_bar = px.bar(
             df_bar,
             x="servico",
             y="faturamento",
-            title="Faturamento por Serviço",
+            title=f"Faturamento por Serviço (top {TOP_N})",
             text_auto=".2f"
         )
 
@@ -713,60 +733,121 @@ import plotly.express as px
 
 with tab4:
     # ===== FILTROS =====
-    meses = ["Todos"] + sorted(dados["mes"].unique())
     col1, col2 = st.columns(2)
     with col1:
-        mes_geo = st.selectbox("Selecione o mês:", meses)
+        periodo_geo = seletor_periodo("Selecione o período:", "filtro_periodo_geo")
     with col2:
         metrica_geo = st.selectbox(
             "Escolha a métrica do mapa:",
             ["faturamento", "lucro", "custo"]
         )
 
-    # ===== FILTRAGEM =====
-    if mes_geo == "Todos":
-        df = dados.copy()
-    else:
-        df = dados[dados["mes"] == mes_geo]
-
-    # ===== AGRUPAMENTO POR ESTADO =====
-    mapa = df.groupby("estado", as_index=False).agg(
-        faturamento=("faturamento", "sum"),
-        lucro=("lucro", "sum"),
-        custo=("custo", "sum")
-    )
-
     # ===== CARREGAR GEOJSON DOS ESTADOS DO BRASIL =====
     url_geojson = "https://raw.githubusercontent.com/codeforamerica/click_that_hood/master/public/data/brazil-states.geojson"
-    geojson = json.loads(requests.get(url_geojson).text)
+
+    @cache.memorizar("geo", ttl=24 * 60 * 60)
+    def carregar_geojson(url):
+        return json.loads(requests.get(url).text)
 
     # ===== MAPA =====
-    fig = px.choropleth_mapbox(
-        mapa,
-        geojson=geojson,
-        locations="estado",
-        featureidkey="properties.sigla",
-        color=metrica_geo,
-        hover_name="estado",
-        hover_data={
-            "faturamento": ":,.2f",
-            "lucro": ":,.2f",
-            "custo": ":,.2f"
-        },
-        mapbox_style="carto-positron",
-        center={"lat": -14.2350, "lon": -51.9253},
-        zoom=3.0,
-        opacity=0.7,
-        color_continuous_scale="Blues"
+    @cache.memorizar("figura")
+    def figura_mapa(periodo, metrica):
+        # ===== AGRUPAMENTO POR ESTADO =====
+        mapa = somas(dados, "estado").agregar(periodo)[["estado", "faturamento", "lucro", "custo"]]
+
+        fig = px.choropleth_mapbox(
+            mapa,
+            geojson=carregar_geojson(url_geojson),
+            locations="estado",
+            featureidkey="properties.sigla",
+            color=metrica,
+            hover_name="estado",
+            hover_data={
+                "faturamento": ":,.2f",
+                "lucro": ":,.2f",
+                "custo": ":,.2f"
+            },
+            mapbox_style="carto-positron",
+            center={"lat": -14.2350, "lon": -51.9253},
+            zoom=3.0,
+            opacity=0.7,
+            color_continuous_scale="Blues"
+        )
+
+        fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
+        return fig
+
+    fig = figura_mapa(periodo_geo, metrica_geo)
+    evento = st.plotly_chart(
+        fig, use_container_width=True, on_select="rerun", selection_mode="points", key="mapa_estados"
     )
 
-    fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
-    st.plotly_chart(fig, use_container_width=True)
+    # ===== DRILL-DOWN DO ESTADO =====
+    arvore = drilldown(dados)
+
+    # Um clique no mapa escolhe o estado; o selectbox continua livre para trocar depois
+    pontos = evento.selection.points if evento else []
+    clicado = pontos[0].get("location") if pontos else None
+    if clicado and clicado != st.session_state.get("estado_clicado"):
+        st.session_state["estado_clicado"] = clicado
+        st.session_state["filtro_estado_drill"] = clicado
+
+    col_uf, col_nivel, _ = st.columns([1, 1, 2])
+    with col_uf:
+        estado_sel = st.selectbox("Detalhar estado", ["Nenhum"] + arvore.estados, key="filtro_estado_drill")
+    with col_nivel:
+        nivel = st.radio("Detalhar por", ["vendedor", "servico"], horizontal=True, key="filtro_nivel_drill",
+                         format_func=lambda n: "Vendedor" if n == "vendedor" else "Serviço")
+
+    if estado_sel != "Nenhum":
+        df_nivel = arvore.detalhar(estado_sel, nivel, periodo=periodo_geo)
+        rotulo_nivel = "Vendedor" if nivel == "vendedor" else "Serviço"
+
+        col_bar, col_cli = st.columns(2)
+        with col_bar:
+            fig_drill = px.bar(
+                top_n(df_nivel, nivel, n=TOP_N),
+                x=nivel,
+                y="faturamento",
+                title=f"Faturamento por {rotulo_nivel.lower()} - {estado_sel}"
+            )
+            fig_drill.update_traces(
+                hovertemplate=f"{rotulo_nivel}: %{{x}}<br>Faturamento: R$ %{{y:,.2f}}"
+            )
+            fig_drill.update_layout(
+                xaxis_title=rotulo_nivel,
+                yaxis_title="Faturamento (R$)",
+                showlegend=False
+            )
+            st.plotly_chart(fig_drill, use_container_width=True)
+
+        with col_cli:
+            membro = seletor_paginado(rotulo_nivel, df_nivel[nivel].tolist(), f"filtro_membro_drill_{nivel}")
+            if membro is not None:
+                st.markdown(f"**Clientes de {membro} em {estado_sel}**")
+                st.dataframe(
+                    arvore.detalhar(estado_sel, nivel, membro, periodo_geo).rename(columns={
+                        "cliente": "Cliente",
+                        "faturamento": "Faturamento",
+                        "lucro": "Lucro",
+                        "custo": "Custo",
+                        "quantidade": "Quantidade",
+                        "vendas": "Vendas"
+                    }),
+                    hide_index=True
+                )
 
 # =============================
 # TAB 5 - PREVISÃO DE FATURAMENTO MENSAL
 # =============================
-from prophet import Prophet
+from concurrent.futures import ThreadPoolExecutor
+
+from previsao_vendas import (
+    PROCESSOS_BACKTEST, backtest, criar_modelo, resumir_backtest, serie_mensal, tamanho_modelo,
+)
+
+# Horizonte máximo da previsão; o backtest é feito uma vez para todos os horizontes
+MAX_HORIZONTE = 12
 
 with tab5:
 
@@ -775,10 +856,7 @@ with tab5:
     # ----------------------------
     # Preparação dos dados - AGREGAR POR MÊS
     # ----------------------------
-    # Usando resample para evitar problemas de coluna
-    df_temp = dados.set_index("data_venda")
-    df_prophet = df_temp["faturamento"].resample("M").sum().reset_index()
-    df_prophet = df_prophet.rename(columns={"data_venda": "ds", "faturamento": "y"})
+    df_prophet = serie_mensal(dados)
 
     # ----------------------------
     # Controles do usuário
@@ -789,7 +867,7 @@ with tab5:
         horizonte = st.number_input(
             "Horizonte da previsão (meses)",
             min_value=1,
-            max_value=12,
+            max_value=MAX_HORIZONTE,
             value=3,
             step=1
         )
@@ -802,17 +880,69 @@ with tab5:
     # ----------------------------
     # Treinamento do modelo Prophet (cache)
     # ----------------------------
-    @st.cache_resource
+    @cache.memorizar("modelo", medir=tamanho_modelo)
     def treinar_modelo(df):
-        model = Prophet(
-            yearly_seasonality=True,
-            weekly_seasonality=False,
-            daily_seasonality=False,
-            seasonality_mode='multiplicative'
-        )
+        model = criar_modelo()
         model.fit(df)
         return model
 
+    @cache.memorizar("modelo")
+    def avaliar_modelo(df):
+        # Backtest disparado uma vez por série, em segundo plano; a tela só consulta o Future.
+        # O cache passa a contar o tamanho do resumo quando o Future termina; se falhar, a falha
+        # é mostrada por TTL_ERRO segundos antes de uma nova tentativa.
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backtest")
+        avaliacao = executor.submit(lambda: resumir_backtest(backtest(df, MAX_HORIZONTE)))
+        executor.shutdown(wait=False)
+        return avaliacao
+
+    avaliacao = avaliar_modelo(df_prophet) if PROCESSOS_BACKTEST > 0 else None
+
+    # ----------------------------
+    # Precisão do modelo (backtest)
+    # ----------------------------
+    # Enquanto o backtest roda, o painel se atualiza a cada 5 s. O intervalo do fragmento só muda
+    # num rerun completo: quando o resultado fica pronto, o painel pede um para parar de se atualizar.
+    acompanhando = avaliacao is not None and not avaliacao.done()
+
+    @st.fragment(run_every=5 if acompanhando else None)
+    def painel_precisao():
+        st.markdown("### 🎯 Precisão do modelo (backtest)")
+
+        if avaliacao is None:
+            st.info("Backtest desativado (BACKTEST_PROCESSOS=0).")
+            return
+        if not avaliacao.done():
+            st.info("Calculando a precisão do modelo em segundo plano...")
+            return
+        if acompanhando:
+            st.rerun()
+        if avaliacao.exception() is not None:
+            st.warning(f"Não foi possível calcular o backtest: {avaliacao.exception()}")
+            return
+
+        resumo = avaliacao.result()
+        if resumo.empty:
+            st.info("Histórico curto demais para avaliar o modelo.")
+            return
+
+        st.caption(
+            "Origem móvel: o modelo é retreinado em cada corte com os meses anteriores e comparado "
+            "com o realizado. A cobertura é a fração de meses dentro do intervalo de confiança (80%)."
+        )
+        st.dataframe(
+            resumo[resumo["h"] <= horizonte].rename(columns={
+                "h": "Meses à frente",
+                "cortes": "Cortes avaliados",
+                "mape": "MAPE (%)",
+                "rmse": "RMSE (R$)",
+                "cobertura": "Cobertura do intervalo (%)"
+            }),
+            hide_index=True
+        )
+
+    painel_precisao()
+
     if processar:
         with st.spinner("Treinando modelo e gerando previsão..."):
             model = treinar_modelo(df_prophet)
@@ -890,5 +1020,14 @@ with tab5:
 
         st.dataframe(previsao_futura)
 
-
-
+# =============================
+# MONITORAMENTO DO CACHE
+# =============================
+with st.sidebar.expander("Cache"):
+    estatisticas = cache.estatisticas()
+    st.metric("Uso", f"{estatisticas['bytes'] / 2**20:,.1f} de {estatisticas['limite_bytes'] / 2**20:,.0f} MB")
+    st.caption(
+        f"{estatisticas['itens']} itens · {estatisticas['acertos']} acertos · {estatisticas['faltas']} faltas · "
+        f"{estatisticas['despejos']} despejos · {estatisticas['erros']} erros"
+    )
+    st.dataframe(pd.DataFrame(estatisticas["categorias"]).T.fillna(0).astype(int))
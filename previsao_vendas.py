@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+import sys
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from prophet import Prophet
+
+from cache_vendas import tamanho_em_bytes
+
+# =============================
+# SÉRIE MENSAL E MODELO
+# =============================
+def serie_mensal(dados):
+    # Faturamento agregado por mês no formato do Prophet (ds, y)
+    df_temp = dados.set_index("data_venda")
+    df_prophet = df_temp["faturamento"].resample("M").sum().reset_index()
+    return df_prophet.rename(columns={"data_venda": "ds", "faturamento": "y"})
+
+def criar_modelo():
+    return Prophet(
+        yearly_seasonality=True,
+        weekly_seasonality=False,
+        daily_seasonality=False,
+        seasonality_mode='multiplicative'
+    )
+
+def tamanho_modelo(model):
+    # Espaço de um Prophet ajustado, para o orçamento do cache: histórico, pontos de mudança e
+    # parâmetros. O backend do Stan pode não ser serializável, e aí a estimativa genérica
+    # contaria só o objeto raso.
+    partes = [model.history, model.history_dates, model.changepoints, model.changepoints_t,
+              model.train_component_cols, dict(model.params)]
+    return sum(tamanho_em_bytes(parte) for parte in partes if parte is not None)
+
+# =============================
+# BACKTEST (ORIGEM MÓVEL)
+# =============================
+# Para cada corte, o modelo é treinado só com os meses até o corte e prevê os
+# `horizonte` meses seguintes, que são comparados com o realizado.
+MESES_TREINO_MINIMO = 12
+MAX_CORTES = 12
+# O backtest roda ao lado das sessões do dashboard: usa só uma fração dos núcleos.
+# Com 0 o dashboard não dispara o backtest (ex.: no teste de carga).
+PROCESSOS_BACKTEST = int(os.environ.get("BACKTEST_PROCESSOS", max(1, (os.cpu_count() or 1) // 4)))
+
+def _avaliar_corte(df_treino, df_teste):
+    # Executado nos processos de trabalho: um ajuste do Prophet por corte
+    import logging
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+
+    model = criar_modelo()
+    model.fit(df_treino)
+    previsao = model.predict(df_teste[["ds"]])
+
+    resultado = previsao[["ds", "yhat", "yhat_lower", "yhat_upper"]].copy()
+    resultado["y"] = df_teste["y"].to_numpy()
+    resultado["corte"] = df_treino["ds"].iloc[-1]
+    resultado["h"] = np.arange(1, len(resultado) + 1)
+    return resultado
+
+_lock_main = threading.Lock()
+
+@contextmanager
+def _main_neutro():
+    # O Streamlit registra o script do dashboard como __main__, e um processo criado com spawn
+    # importa o __main__ do pai: reexecutaria o dashboard inteiro. Enquanto os processos são
+    # criados, o __main__ vira um módulo vazio; os filhos importam só este módulo (_avaliar_corte).
+    with _lock_main:
+        original = sys.modules["__main__"]
+        sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            yield
+        finally:
+            sys.modules["__main__"] = original
+
+def cortes_backtest(n_meses, treino_minimo=MESES_TREINO_MINIMO, max_cortes=MAX_CORTES):
+    # Tamanhos de treino de cada corte, do mais recente para trás
+    ultimo = n_meses - 1
+    return list(range(ultimo, treino_minimo - 1, -1))[:max_cortes][::-1]
+
+def backtest(df_prophet, horizonte, treino_minimo=MESES_TREINO_MINIMO, max_cortes=MAX_CORTES, processos=None):
+    # Previsões de todos os cortes, com uma linha por (corte, h); cortes rodam em paralelo
+    df_prophet = df_prophet.reset_index(drop=True)
+    cortes = cortes_backtest(len(df_prophet), treino_minimo, max_cortes)
+    if not cortes:
+        return pd.DataFrame(columns=["ds", "yhat", "yhat_lower", "yhat_upper", "y", "corte", "h"])
+
+    # spawn, e não fork: o processo do dashboard tem várias threads (API, sessões, BLAS)
+    # e um fork no meio delas pode deixar o filho travado num lock
+    contexto = multiprocessing.get_context("spawn")
+    processos = min(processos or PROCESSOS_BACKTEST, len(cortes))
+    with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as executor:
+        # Os processos são criados nos submit
+        with _main_neutro():
+            tarefas = [
+                executor.submit(_avaliar_corte, df_prophet.iloc[:k], df_prophet.iloc[k:k + horizonte])
+                for k in cortes
+            ]
+        resultados = [tarefa.result() for tarefa in tarefas]
+
+    return pd.concat(resultados, ignore_index=True)
+
+def resumir_backtest(resultado):
+    # MAPE, RMSE e cobertura do intervalo por horizonte (meses à frente do corte)
+    erro = resultado["yhat"] - resultado["y"]
+    y = resultado["y"].where(resultado["y"] != 0)
+    avaliacao = resultado.assign(
+        erro_pct=(erro.abs() / y.abs()) * 100,
+        erro_quad=erro ** 2,
+        coberto=resultado["y"].between(resultado["yhat_lower"], resultado["yhat_upper"]) * 100,
+    )
+    return avaliacao.groupby("h").agg(
+        cortes=("corte", "size"),
+        mape=("erro_pct", "mean"),
+        rmse=("erro_quad", lambda q: np.sqrt(q.mean())),
+        cobertura=("coberto", "mean"),
+    ).reset_index()
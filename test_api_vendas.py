@@ -0,0 +1,100 @@
+import asyncio
+import io
+import threading
+
+import pandas as pd
+import pytest
+import requests
+import tornado.httpserver
+import tornado.testing
+
+import api_vendas
+import dados_vendas as dv
+
+# =============================
+# SERVIDOR DE TESTE
+# =============================
+# A API real numa porta livre, servindo o DataFrame sintético
+@pytest.fixture(scope="module")
+def url(dados):
+    api_vendas.estado.publicar(dados)
+    soquete, porta = tornado.testing.bind_unused_port()
+    pronto = threading.Event()
+
+    async def servir():
+        tornado.httpserver.HTTPServer(api_vendas.criar_app()).add_sockets([soquete])
+        pronto.set()
+        await asyncio.Event().wait()
+
+    threading.Thread(target=asyncio.run, args=(servir(),), daemon=True).start()
+    pronto.wait()
+    return f"http://127.0.0.1:{porta}"
+
+# =============================
+# KPIs E AGREGADOS
+# =============================
+def test_kpis_sem_filtro(url, dados):
+    resposta = requests.get(f"{url}/api/kpis")
+    assert resposta.status_code == 200
+    corpo = resposta.json()
+    esperado = dv.calcular_kpis(dados)
+    for nome, valor in esperado.items():
+        assert corpo["kpis"][nome] == pytest.approx(valor), nome
+    assert corpo["variacao"] is None
+
+def test_kpis_do_mes_com_variacao(url, dados):
+    corpo = requests.get(f"{url}/api/kpis", params={"mes": "2024-05", "vendedor": "Ana"}).json()
+    atual = dv.calcular_kpis(dv.filtrar(dados, mes="2024-05", vendedor="Ana"))
+    anterior = dv.calcular_kpis(dv.filtrar(dados, mes="2024-04", vendedor="Ana"))
+    assert corpo["filtros"] == {"mes": "2024-05", "vendedor": "Ana"}
+    for nome, valor in dv.variacao_kpis(atual, anterior).items():
+        assert corpo["variacao"][nome] == pytest.approx(valor), nome
+
+def test_agregados(url, dados):
+    corpo = requests.get(f"{url}/api/agregados/vendedor", params={"mes": "2024-05"}).json()
+    esperado = dv.agregar(dv.filtrar(dados, mes="2024-05"), "vendedor")
+    assert [linha["vendedor"] for linha in corpo["dados"]] == esperado["vendedor"].tolist()
+    assert [linha["faturamento"] for linha in corpo["dados"]] == pytest.approx(esperado["faturamento"].tolist())
+
+def test_mes_sem_dados_responde_vazio(url):
+    resposta = requests.get(f"{url}/api/agregados/vendedor", params={"mes": "2030-01"})
+    assert resposta.status_code == 200
+    assert resposta.json()["dados"] == []
+
+def test_etag_devolve_304(url):
+    primeira = requests.get(f"{url}/api/kpis", params={"mes": "2024-05"})
+    etag = primeira.headers["Etag"]
+    segunda = requests.get(f"{url}/api/kpis", params={"mes": "2024-05"}, headers={"If-None-Match": etag})
+    assert segunda.status_code == 304
+    assert segunda.content == b""
+    outra = requests.get(f"{url}/api/kpis", params={"mes": "2024-06"}, headers={"If-None-Match": etag})
+    assert outra.status_code == 200
+
+def test_exportar_csv_em_blocos(url, dados):
+    resposta = requests.get(f"{url}/api/exportar/csv", params={"vendedor": "Ana", "inicio": "2024-02-10", "fim": "2024-04-05"})
+    assert resposta.status_code == 200
+    assert resposta.headers["Content-Type"].startswith("text/csv")
+    obtido = pd.read_csv(io.BytesIO(resposta.content))
+    esperado = dv.filtrar(dv.fatiar_periodo(dados, dv.periodo_intervalo("2024-02-10", "2024-04-05")), vendedor="Ana")
+    assert obtido["cliente"].tolist() == esperado["cliente"].tolist()
+
+# =============================
+# ERROS
+# =============================
+@pytest.mark.parametrize("caminho", ["/api/kpis", "/api/agregados/vendedor", "/api/exportar/csv"])
+@pytest.mark.parametrize("mes", ["abc", "2024-13", "2024-T2", "Ano até a data", "2024-5"])
+def test_mes_invalido_responde_400(url, caminho, mes):
+    assert requests.get(f"{url}{caminho}", params={"mes": mes}).status_code == 400
+
+def test_dimensao_desconhecida_responde_404(url):
+    assert requests.get(f"{url}/api/agregados/cidade").status_code == 404
+    assert requests.get(f"{url}/api/exportar/xlsx").status_code == 404
+
+def test_exportar_data_invalida_responde_400(url):
+    assert requests.get(f"{url}/api/exportar/csv", params={"inicio": "ontem"}).status_code == 400
+
+def test_periodo_mes():
+    periodo = dv.periodo_mes("2024-02")
+    assert (periodo.inicio, periodo.fim, periodo.mes) == (pd.Timestamp("2024-02-01"), pd.Timestamp("2024-02-29"), "2024-02")
+    with pytest.raises(ValueError):
+        dv.periodo_mes("2024-T1")
@@ -0,0 +1,119 @@
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+
+from cache_vendas import GerenciadorCache
+
+# =============================
+# ORÇAMENTO, VERSÃO E TTL
+# =============================
+def test_cache_despeja_lru_pelo_tamanho():
+    cache = GerenciadorCache(limite_bytes=1000)
+    for i in range(5):
+        cache.guardar(("x", i), np.zeros(30))  # 240 bytes cada
+    assert cache.estatisticas()["despejos"] == 1
+    assert cache.obter(("x", 0)) is None
+    cache.obter(("x", 1))
+    cache.guardar(("x", 5), np.zeros(30))
+    assert cache.obter(("x", 1)) is not None
+    assert cache.obter(("x", 2)) is None
+    assert cache.bytes <= cache.limite_bytes
+
+def test_cache_rejeita_item_maior_que_o_orcamento():
+    cache = GerenciadorCache(limite_bytes=1000)
+    cache.guardar(("x", 1), np.zeros(10))
+    cache.guardar(("x", 2), np.zeros(1000))
+    assert cache.obter(("x", 2)) is None
+    assert cache.obter(("x", 1)) is not None
+    assert cache.estatisticas()["rejeitados"] == 1
+
+def test_cache_invalida_ao_trocar_versao():
+    cache = GerenciadorCache()
+    cache.definir_versao(1)
+    cache.guardar(("x", 1), "a")
+    cache.definir_versao(2)
+    assert cache.obter(("x", 1)) is None
+    assert cache.bytes == 0
+    # Calculado com a versão antiga e guardado depois da troca: descartado
+    cache.guardar(("x", 2), "b", versao=1)
+    assert cache.obter(("x", 2)) is None
+
+def test_cache_ttl():
+    cache = GerenciadorCache()
+    cache.guardar(("x", 1), "a", ttl=0.01)
+    time.sleep(0.02)
+    assert cache.obter(("x", 1)) is None
+    assert cache.estatisticas()["expiracoes"] == 1
+
+def test_cache_memorizar_ignora_argumentos_com_sublinhado():
+    cache = GerenciadorCache()
+    chamadas = []
+
+    @cache.memorizar("agregado")
+    def somar(_df, coluna):
+        chamadas.append(coluna)
+        return _df[coluna].sum()
+
+    df = pd.DataFrame({"a": [1, 2], "b": [3, 4]})
+    assert somar(df, "a") == 3
+    assert somar(df.copy(), "a") == 3
+    assert somar(df, "b") == 7
+    assert chamadas == ["a", "b"]
+
+def test_cache_memorizar_com_medida_explicita():
+    cache = GerenciadorCache()
+
+    @cache.memorizar("modelo", medir=lambda valor: 12345)
+    def treinar(n):
+        return object()
+
+    treinar(1)
+    assert cache.estatisticas()["categorias"]["modelo"]["bytes"] == 12345
+
+# =============================
+# CÁLCULOS EM SEGUNDO PLANO
+# =============================
+def test_futuro_que_falhou_fica_ate_o_ttl_de_erro():
+    cache = GerenciadorCache(ttl_erro=0.05)
+    ok, falha = Future(), Future()
+    cache.guardar(("modelo", 1), ok)
+    cache.guardar(("modelo", 2), falha)
+    ok.set_result(1)
+    falha.set_exception(RuntimeError("backtest"))
+    assert cache.obter(("modelo", 1)) is ok
+    # Durante o TTL de erro a falha é reaproveitada, sem novo cálculo a cada rerun
+    assert cache.obter(("modelo", 2)) is falha
+    assert cache.estatisticas()["erros"] == 1
+    time.sleep(0.06)
+    assert cache.obter(("modelo", 2)) is None
+    assert cache.obter(("modelo", 1)) is ok
+
+def test_futuro_que_falhou_e_recalculado_depois_do_ttl_de_erro():
+    cache = GerenciadorCache(ttl_erro=0.05)
+    chamadas = []
+
+    @cache.memorizar("modelo")
+    def avaliar(n):
+        futuro = Future()
+        chamadas.append(n)
+        futuro.set_exception(RuntimeError("backtest"))
+        return futuro
+
+    avaliar(1)
+    avaliar(1)
+    assert chamadas == [1]
+    time.sleep(0.06)
+    avaliar(1)
+    assert chamadas == [1, 1]
+
+def test_cache_mede_futuro_quando_termina():
+    cache = GerenciadorCache(limite_bytes=10_000)
+    cache.guardar(("agregado", 1), np.zeros(500))  # 4000 bytes
+    futuro = Future()
+    cache.guardar(("modelo", 1), futuro)
+    futuro.set_result(np.zeros(1000))  # 8000 bytes: o item mais antigo é despejado
+    assert cache.obter(("modelo", 1)) is futuro
+    assert cache.obter(("agregado", 1)) is None
+    assert cache.bytes == 8000
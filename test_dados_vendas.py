@@ -0,0 +1,324 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dados_vendas as dv
+
+def _mesmo_valor(obtido, esperado):
+    if esperado is None:
+        return obtido is None
+    return obtido is not None and obtido == pytest.approx(esperado)
+
+def _kpis(df):
+    fat, lucro, qtd = df["faturamento"].sum(), df["lucro"].sum(), df["quantidade"].sum()
+    return {
+        "faturamento": fat,
+        "lucro": lucro,
+        "quantidade": qtd,
+        "clientes": df["cliente"].nunique(),
+        "ticket": fat / qtd if qtd > 0 else 0,
+        "margem": lucro / fat * 100 if fat > 0 else 0,
+        "media": fat / len(df) if len(df) > 0 else 0,
+    }
+
+# =============================
+# COMPARAÇÃO ENTRE PERÍODOS
+# =============================
+# Cada política reproduz a busca de "mês anterior" que a respectiva aba fazia linha a linha
+def test_calendario_igual_ao_mes_anterior_do_calendario(dados):
+    # Visão geral: mês anterior do calendário, mesmo sem vendas
+    tabela = dv.comparar_periodos(dados)
+    for mes in sorted(dados["mes"].unique()):
+        atual = _kpis(dados[dados["mes"] == mes])
+        anterior = _kpis(dados[dados["mes"] == dv.mes_anterior(mes)])
+        var = dv.variacoes(tabela, mes)
+        for metrica in ("faturamento", "lucro", "quantidade", "clientes", "ticket", "margem"):
+            assert _mesmo_valor(var[metrica], dv.calc_var(atual[metrica], anterior[metrica])), (mes, metrica)
+
+def test_ativo_igual_ao_ultimo_mes_do_vendedor(dados):
+    # Vendedores: último mês em que o próprio vendedor vendeu
+    tabela = dv.comparar_periodos(dados, "vendedor", "ativo")
+    for vendedor in sorted(dados["vendedor"].unique()):
+        df_vend = dados[dados["vendedor"] == vendedor]
+        meses_vendedor = sorted(df_vend["mes"].unique())
+        for idx, mes in enumerate(meses_vendedor):
+            var = dv.variacoes(tabela, mes, vendedor)
+            if idx == 0:
+                assert var["faturamento"] is None
+                continue
+            atual = _kpis(df_vend[df_vend["mes"] == mes])
+            anterior = _kpis(df_vend[df_vend["mes"] == meses_vendedor[idx - 1]])
+            for metrica in ("faturamento", "lucro", "quantidade", "clientes", "media", "margem"):
+                assert _mesmo_valor(var[metrica], dv.calc_var(atual[metrica], anterior[metrica])), \
+                    (vendedor, mes, metrica)
+
+@pytest.mark.parametrize("dimensao,coluna", [(None, None), ("categoria", "categoria_servico"), ("servico", "servico")])
+def test_global_igual_ao_mes_anterior_do_dataset(dados, dimensao, coluna):
+    # Serviços: mês anterior dentre os meses com vendas no dataset
+    meses = sorted(dados["mes"].unique())
+    tabela = dv.comparar_periodos(dados, dimensao, "global", meses=meses)
+    membros = [None] if coluna is None else sorted(dados[coluna].unique())
+    for membro in membros:
+        df_membro = dados if membro is None else dados[dados[coluna] == membro]
+        for idx, mes in enumerate(meses[1:], start=1):
+            atual = _kpis(df_membro[df_membro["mes"] == mes])
+            anterior = _kpis(df_membro[df_membro["mes"] == meses[idx - 1]])
+            var = dv.variacoes(tabela, mes, membro)
+            for metrica in ("faturamento", "lucro", "quantidade", "ticket", "margem"):
+                assert _mesmo_valor(var[metrica], dv.calc_var(atual[metrica], anterior[metrica])), \
+                    (membro, mes, metrica)
+
+def test_variacao_anual_alinhada_pelo_calendario(dados):
+    tabela = dv.comparar_periodos(dados, "vendedor", "ativo")
+    for _, linha in tabela.iterrows():
+        mes_aa = (pd.Period(linha["mes"], "M") - 12).strftime("%Y-%m")
+        anterior = dados.loc[(dados["mes"] == mes_aa) & (dados["vendedor"] == linha["vendedor"]), "faturamento"].sum()
+        esperado = dv.calc_var(linha["faturamento"], anterior)
+        obtido = None if pd.isna(linha["var_faturamento_aa"]) else linha["var_faturamento_aa"]
+        assert _mesmo_valor(obtido, esperado), (linha["mes"], linha["vendedor"])
+
+def test_politica_desconhecida(dados):
+    with pytest.raises(ValueError):
+        dv.comparar_periodos(dados, politica="outra")
+
+# =============================
+# PERÍODOS E SOMAS ACUMULADAS
+# =============================
+PERIODOS = [
+    dv.PERIODO_TOTAL,
+    dv.interpretar_periodo("2024-03", None),
+    dv.interpretar_periodo("2023-07", None),
+    dv.interpretar_periodo("2023-T3", None),
+    dv.interpretar_periodo("Ano até a data", "2024-06-15"),
+    dv.periodo_intervalo("2023-02-10", "2023-02-10"),
+    dv.periodo_intervalo("2022-06-01", "2023-01-15"),
+    dv.periodo_intervalo("2024-12-20", "2025-03-01"),
+    dv.periodo_intervalo("2025-01-01", "2025-02-01"),
+]
+
+@pytest.mark.parametrize("periodo", PERIODOS, ids=lambda p: p.rotulo)
+def test_fatiar_periodo_igual_a_mascara(dados, periodo):
+    mascara = pd.Series(True, index=dados.index)
+    if periodo.inicio is not None:
+        mascara &= dados["data_venda"] >= periodo.inicio
+    if periodo.fim is not None:
+        mascara &= dados["data_venda"] < periodo.fim + pd.Timedelta(days=1)
+    pd.testing.assert_frame_equal(dv.fatiar_periodo(dados, periodo), dados[mascara])
+
+@pytest.mark.parametrize("periodo", PERIODOS, ids=lambda p: p.rotulo)
+@pytest.mark.parametrize("dimensao", [None, "vendedor", "servico"])
+def test_somas_acumuladas_iguais_as_linhas(dados, dimensao, periodo):
+    somas = dv.SomasAcumuladas(dados, dimensao)
+    fatia = dv.fatiar_periodo(dados, periodo)
+    coluna = dv.DIMENSOES.get(dimensao)
+    membros = [None] if coluna is None else sorted(dados[coluna].unique())
+    for membro in membros:
+        linhas = fatia if membro is None else fatia[fatia[coluna] == membro]
+        total = somas.total(periodo, membro)
+        for metrica in dv.METRICAS:
+            assert total[metrica] == pytest.approx(linhas[metrica].sum()), (membro, metrica)
+        assert total["vendas"] == len(linhas)
+
+    if coluna is not None:
+        esperado = dv.agregar(fatia, dimensao).reset_index(drop=True)
+        obtido = somas.agregar(periodo)
+        assert obtido[coluna].tolist() == esperado[coluna].tolist()
+        for metrica in dv.METRICAS:
+            np.testing.assert_allclose(obtido[metrica], esperado[metrica])
+
+def test_somas_membro_desconhecido(dados):
+    total = dv.SomasAcumuladas(dados, "vendedor").total(dv.PERIODO_TOTAL, "Ninguém")
+    assert all(valor == 0 for valor in total.values())
+
+# =============================
+# TOP-N
+# =============================
+def test_top_n_soma_o_restante_em_outros(dados):
+    tabela = dv.agregar(dados, "cliente")
+    resultado = dv.top_n(tabela, "cliente", n=5)
+    assert len(resultado) == 6
+    assert resultado["cliente"].iloc[-1] == dv.ROTULO_OUTROS
+    esperados = tabela.nlargest(5, "faturamento")["cliente"].tolist()
+    assert resultado["cliente"].iloc[:5].tolist() == esperados
+    for metrica in dv.METRICAS:
+        assert resultado[metrica].sum() == pytest.approx(tabela[metrica].sum())
+
+def test_top_n_sem_cauda(dados):
+    tabela = dv.agregar(dados, "vendedor")
+    resultado = dv.top_n(tabela, "vendedor", n=10)
+    assert dv.ROTULO_OUTROS not in resultado["vendedor"].tolist()
+    assert resultado["faturamento"].is_monotonic_decreasing
+
+def test_buscar_opcoes():
+    opcoes = ["Ana Souza", "Bia Lima", "Caio", 2024]
+    assert dv.buscar_opcoes(opcoes, "  ") == opcoes
+    assert dv.buscar_opcoes(opcoes, "LIMA") == ["Bia Lima"]
+    assert dv.buscar_opcoes(opcoes, "a") == ["Ana Souza", "Bia Lima", "Caio"]
+    assert dv.buscar_opcoes(opcoes, "202") == [2024]
+
+# =============================
+# DRILL-DOWN POR ESTADO
+# =============================
+def _esperado_drill(df, coluna):
+    return df.groupby(coluna)["faturamento"].agg(["sum", "size"]).sort_values("sum", ascending=False)
+
+@pytest.mark.parametrize("nivel", dv.NIVEIS_DRILL)
+@pytest.mark.parametrize("periodo", [dv.PERIODO_TOTAL, dv.interpretar_periodo("2024-T2", None)], ids=lambda p: p.rotulo)
+def test_drill_down_por_estado(dados, nivel, periodo):
+    drill = dv.DrillDownEstados(dados)
+    assert drill.estados == sorted(dados["estado"].unique())
+    fatia = dv.fatiar_periodo(dados, periodo)
+    for estado in drill.estados:
+        df_estado = fatia[fatia["estado"] == estado]
+        obtido = drill.detalhar(estado, nivel, periodo=periodo)
+        esperado = _esperado_drill(df_estado, nivel)
+        assert obtido[nivel].tolist() == esperado.index.tolist()
+        np.testing.assert_allclose(obtido["faturamento"], esperado["sum"])
+        assert obtido["vendas"].tolist() == esperado["size"].tolist()
+
+        # Segundo nível: clientes do primeiro membro dentro do estado
+        membro = obtido[nivel].iloc[0]
+        clientes = drill.detalhar(estado, nivel, membro, periodo)
+        esperado = _esperado_drill(df_estado[df_estado[nivel] == membro], "cliente")
+        assert sorted(clientes["cliente"]) == sorted(esperado.index)
+        assert clientes["faturamento"].sum() == pytest.approx(esperado["sum"].sum())
+        assert clientes["faturamento"].is_monotonic_decreasing
+
+def test_drill_down_estado_desconhecido(dados):
+    drill = dv.DrillDownEstados(dados)
+    assert drill.detalhar("AM").empty
+    with pytest.raises(ValueError):
+        drill.detalhar("SP", "cliente")
+
+# =============================
+# EXPORTAÇÃO EM BLOCOS
+# =============================
+FILTROS_EXPORTACAO = [
+    ({}, dv.PERIODO_TOTAL),
+    ({"vendedor": "Ana"}, dv.interpretar_periodo("2024-T1", None)),
+    ({"categoria": "C1", "servico": "S2"}, dv.periodo_intervalo("2023-03-05", "2024-02-20")),
+    ({"vendedor": "Bia", "mes": "2024-05"}, dv.PERIODO_TOTAL),
+    ({"vendedor": "Ninguém"}, dv.PERIODO_TOTAL),
+    ({"categoria": "Todas", "servico": "Todos"}, dv.interpretar_periodo("2023-07", None)),
+    ({"mes": "2023-07"}, dv.PERIODO_TOTAL),
+    ({"mes": "2024-02", "estado": "SP"}, dv.periodo_intervalo("2024-02-10", "2024-03-10")),
+]
+
+@pytest.fixture(scope="module", params=["memoria", "particoes"])
+def fonte(request, dados, tmp_path_factory):
+    if request.param == "memoria":
+        return dv.DadosEmMemoria(dados)
+    pytest.importorskip("pyarrow")
+    diretorio = tmp_path_factory.mktemp("particoes")
+    dv.particionar_dados(dados, str(diretorio))
+    return dv.ArmazemMensal(str(diretorio))
+
+@pytest.mark.parametrize("filtros,periodo", FILTROS_EXPORTACAO)
+def test_exportar_csv(dados, fonte, filtros, periodo):
+    esperado = dv.filtrar(dv.fatiar_periodo(dados, periodo), **filtros)
+    conteudo = b"".join(dv.exportar(fonte, "csv", periodo, tamanho_bloco=97, **filtros))
+    obtido = pd.read_csv(io.BytesIO(conteudo))
+    assert list(obtido.columns) == list(dados.columns)
+    assert len(obtido) == len(esperado)
+    np.testing.assert_allclose(obtido["faturamento"].astype(float), esperado["faturamento"])
+    assert obtido["cliente"].tolist() == esperado["cliente"].tolist()
+
+@pytest.mark.parametrize("filtros,periodo", FILTROS_EXPORTACAO)
+def test_exportar_parquet(dados, fonte, filtros, periodo):
+    pytest.importorskip("pyarrow")
+    esperado = dv.filtrar(dv.fatiar_periodo(dados, periodo), **filtros).reset_index(drop=True)
+    conteudo = b"".join(dv.exportar(fonte, "parquet", periodo, tamanho_bloco=97, **filtros))
+    pd.testing.assert_frame_equal(pd.read_parquet(io.BytesIO(conteudo)), esperado, check_dtype=False)
+
+def test_exportar_em_blocos(dados):
+    fonte = dv.DadosEmMemoria(dados)
+    pedacos = list(dv.exportar(fonte, "csv", tamanho_bloco=500))
+    assert len(pedacos) == -(-len(dados) // 500)
+    assert sum(pedaco.startswith(b"data_venda,") for pedaco in pedacos) == 1
+
+def test_exportar_formato_desconhecido(dados):
+    with pytest.raises(ValueError):
+        dv.exportar(dv.DadosEmMemoria(dados), "xlsx")
+
+@pytest.mark.parametrize("mes", ["2024-T1", "Ano até a data", "2024-13"])
+def test_exportar_mes_e_um_unico_mes(fonte, mes):
+    # Trimestres e afins não viram filtro de mês em nenhuma das fontes
+    with pytest.raises(ValueError):
+        dv.exportar(fonte, "csv", mes=mes)
+
+def test_vazio_tem_as_colunas_das_particoes(dados, fonte):
+    vazio = fonte.vazio()
+    assert vazio.empty
+    assert vazio.dtypes.to_dict() == fonte.ler(["2024-05"]).dtypes.to_dict()
+
+# =============================
+# PARTIÇÕES MENSAIS
+# =============================
+COLUNAS_CSV = [
+    "data_venda", "vendedor", "equipe", "servico", "categoria_servico", "estado", "cliente",
+    "quantidade", "preco_unitario", "custo",
+]
+
+@pytest.fixture
+def csv(dados, tmp_path):
+    pytest.importorskip("pyarrow")
+    caminho = tmp_path / "relatorio_final.csv"
+    dados[COLUNAS_CSV].to_csv(caminho, index=False)
+    return str(caminho), str(tmp_path / "particoes")
+
+def _envelhecer_particoes(diretorio, segundos):
+    for nome in os.listdir(diretorio):
+        caminho = os.path.join(diretorio, nome)
+        os.utime(caminho, (os.path.getmtime(caminho) - segundos,) * 2)
+
+def test_carregar_dados_grava_e_reusa_particoes(dados, csv):
+    caminho, diretorio = csv
+    assert not dv.particoes_atualizadas(caminho, diretorio)
+    primeira = dv.carregar_dados(caminho, diretorio)
+    assert dv.particoes_atualizadas(caminho, diretorio)
+    assert sorted(dv.ArmazemMensal(diretorio).meses) == sorted(dados["mes"].unique())
+
+    segunda = dv.carregar_dados(caminho, diretorio)
+    pd.testing.assert_frame_equal(segunda.drop(columns="dia"), primeira.drop(columns="dia"), check_dtype=False)
+    assert segunda["dia"].tolist() == primeira["dia"].tolist()
+
+def test_csv_mais_novo_regrava_as_particoes(csv):
+    caminho, diretorio = csv
+    dv.carregar_dados(caminho, diretorio)
+    _envelhecer_particoes(diretorio, 60)
+    assert not dv.particoes_atualizadas(caminho, diretorio)
+
+    # O CSV perde os meses de 2024: as partições deles somem na regravação
+    df = pd.read_csv(caminho)
+    df[df["data_venda"] < "2024-01-01"].to_csv(caminho, index=False)
+    dados = dv.carregar_dados(caminho, diretorio)
+    assert dv.particoes_atualizadas(caminho, diretorio)
+    assert dv.ArmazemMensal(diretorio).meses == sorted(dados["mes"].unique())
+    assert max(dados["mes"]) == "2023-12"
+
+def test_particoes_sem_csv(csv):
+    caminho, diretorio = csv
+    assert not dv.particoes_atualizadas(caminho, diretorio)
+    dv.carregar_dados(caminho, diretorio)
+    os.remove(caminho)
+    assert dv.particoes_atualizadas(caminho, diretorio)
+    assert dv.versao_dados(caminho, diretorio) is not None
+
+def test_particionar_concorrente(dados, tmp_path):
+    # Dois processos (dashboard e API avulsa) regravando juntos: cada um usa seu temporário
+    pytest.importorskip("pyarrow")
+    diretorio = str(tmp_path)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for resultado in [executor.submit(dv.particionar_dados, dados, diretorio) for _ in range(4)]:
+            resultado.result()
+    assert sorted(os.listdir(diretorio)) == [f"mes={mes}.parquet" for mes in sorted(dados["mes"].unique())]
+    pd.testing.assert_frame_equal(dv.ArmazemMensal(diretorio).ler().drop(columns="dia"), dados.drop(columns="dia"))
+
+def test_ler_meses_desconhecidos(dados):
+    fonte = dv.DadosEmMemoria(dados)
+    assert fonte.ler(["2030-01", "2024-T2", "abc"]).empty
+    assert len(fonte.ler(["2024-05", "2030-01"])) == (dados["mes"] == "2024-05").sum()
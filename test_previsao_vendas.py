@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cache_vendas import tamanho_em_bytes
+from previsao_vendas import cortes_backtest, criar_modelo, resumir_backtest, serie_mensal, tamanho_modelo
+
+# =============================
+# CORTES DO BACKTEST
+# =============================
+def test_cortes_do_mais_antigo_ao_mais_recente():
+    # 30 meses: no máximo 12 cortes, o último treina com todos os meses menos o final
+    assert cortes_backtest(30) == list(range(18, 30))
+    assert cortes_backtest(30, max_cortes=3) == [27, 28, 29]
+
+def test_cortes_respeitam_o_treino_minimo():
+    assert cortes_backtest(15) == [12, 13, 14]
+    assert cortes_backtest(13) == [12]
+    assert cortes_backtest(12) == []
+    assert cortes_backtest(5, treino_minimo=2) == [2, 3, 4]
+
+def test_serie_mensal_inclui_meses_sem_vendas(dados):
+    serie = serie_mensal(dados)
+    assert list(serie.columns) == ["ds", "y"]
+    assert len(serie) == 24
+    assert serie.loc[serie["ds"] == "2023-07-31", "y"].item() == 0
+    assert serie["y"].sum() == pytest.approx(dados["faturamento"].sum())
+
+# =============================
+# RESUMO DO BACKTEST
+# =============================
+def _previsoes():
+    # Dois cortes, dois meses à frente cada
+    return pd.DataFrame({
+        "corte": pd.to_datetime(["2024-01-31", "2024-01-31", "2024-02-29", "2024-02-29"]),
+        "h": [1, 2, 1, 2],
+        "y": [100.0, 200.0, 0.0, 400.0],
+        "yhat": [110.0, 150.0, 10.0, 400.0],
+        "yhat_lower": [90.0, 160.0, -5.0, 300.0],
+        "yhat_upper": [120.0, 190.0, 20.0, 500.0],
+    })
+
+def test_resumo_por_horizonte():
+    resumo = resumir_backtest(_previsoes())
+    assert resumo["h"].tolist() == [1, 2]
+    assert resumo["cortes"].tolist() == [2, 2]
+    # y = 0 fica fora do MAPE
+    np.testing.assert_allclose(resumo["mape"], [10.0, 12.5])
+    np.testing.assert_allclose(resumo["rmse"], [10.0, np.sqrt(50 ** 2 / 2)])
+    np.testing.assert_allclose(resumo["cobertura"], [100.0, 50.0])
+
+def test_resumo_vazio():
+    vazio = pd.DataFrame(columns=["ds", "yhat", "yhat_lower", "yhat_upper", "y", "corte", "h"])
+    assert resumir_backtest(vazio).empty
+
+# =============================
+# TAMANHO DO MODELO NO CACHE
+# =============================
+def test_tamanho_modelo_conta_historico_e_parametros(dados):
+    model = criar_modelo()
+    model.fit(serie_mensal(dados))
+    tamanho = tamanho_modelo(model)
+    assert tamanho > tamanho_em_bytes(model.history)
+    assert tamanho >= sum(valor.nbytes for valor in model.params.values())
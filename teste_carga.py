@@ -0,0 +1,197 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import random
+import resource
+import time
+
+import numpy as np
+import pandas as pd
+
+# =============================
+# TESTE DE CARGA DO DASHBOARD
+# =============================
+# Simula N sessões simultâneas com o AppTest do Streamlit (sem navegador). Cada sessão
+# troca os filtros de período/vendedor/categoria das abas e mede o tempo de cada rerun.
+#
+#   python teste_carga.py --sessoes 1 5 10 25 --interacoes 20
+#
+# Cada sessão roda no seu próprio processo: o AppTest troca estado global do processo
+# (o Runtime do Streamlit e a configuração) a cada rerun, e sessões em threads de um mesmo
+# processo derrubariam umas às outras. Por isso cada sessão tem a sua cópia dos dados e do
+# cache, e as medidas são do custo de N sessões independentes disputando a CPU.
+# O backtest da aba de previsão fica desligado (BACKTEST_PROCESSOS=0): seus processos
+# disputariam CPU com as sessões e ficariam fora das medidas de CPU e memória.
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dashboard_vendas.py")
+
+# Selectbox alterados nas interações (chaves definidas em dashboard_vendas.py)
+FILTROS = [
+    "filtro_periodo_tab1",
+    "filtro_vendedor",
+    "filtro_mesv",
+    "filtro_bar",
+    "filtro_mes",
+    "filtro_mes_tab3",
+    "filtro_cat_tab3",
+    "filtro_serv_tab3",
+    "filtro_mes_tab_bar",
+    "filtro_mes_tab_bars",
+    "filtro_periodo_geo",
+]
+# Limite da primeira execução de cada sessão, que carrega os dados, e da espera pelas demais
+TIMEOUT_AQUECIMENTO = 600
+# Opções que abrem widgets extras e não fazem parte da simulação
+IGNORADAS = {"Intervalo personalizado"}
+
+# Colunas do resultado, na ordem em que são impressas
+COLUNAS = [
+    "sessoes", "reruns", "erros", "p50_ms", "p90_ms", "p95_ms", "p99_ms", "max_ms",
+    "reruns_por_s", "cpu_s", "cpu_pct", "pico_memoria_mb", "pico_sessao_mb",
+]
+
+def _sessao(app, interacoes, semente, timeout, barreira, resultados):
+    # Executado num processo próprio; devolve as medidas desta sessão pela fila `resultados`
+    from streamlit.testing.v1 import AppTest
+
+    sorteio = random.Random(semente)
+    tempos, erros = [], []
+    try:
+        # Aquecimento: carga dos dados e caches da sessão fora da medição (sem o limite por rerun)
+        at = AppTest.from_file(app, default_timeout=timeout)
+        at.run(timeout=max(timeout, TIMEOUT_AQUECIMENTO))
+        barreira.wait()
+    except Exception as erro:
+        # Libera as outras sessões da barreira; todos os reruns desta contam como erro
+        barreira.abort()
+        resultados.put({"tempos": [], "erros": [repr(erro)] * (interacoes + 1), "cpu": 0.0,
+                        "memoria": 0.0, "inicio": None, "fim": None})
+        return
+
+    uso_ini = resource.getrusage(resource.RUSAGE_SELF)
+    inicio_sessao = time.time()
+    for i in range(interacoes + 1):
+        try:
+            if i > 0:
+                chave = sorteio.choice(FILTROS)
+                opcoes = [o for o in at.selectbox(key=chave).options if o not in IGNORADAS]
+                at.selectbox(key=chave).set_value(sorteio.choice(opcoes))
+            inicio = time.perf_counter()
+            at.run()
+        except Exception as erro:
+            # Rerun que estourou o timeout (ou falhou) conta como erro e a sessão segue
+            erros.append(repr(erro))
+            continue
+        tempos.append(time.perf_counter() - inicio)
+        erros.extend(e.value for e in at.exception)
+    fim_sessao = time.time()
+    uso_fim = resource.getrusage(resource.RUSAGE_SELF)
+
+    resultados.put({
+        "tempos": tempos,
+        "erros": erros,
+        "cpu": (uso_fim.ru_utime - uso_ini.ru_utime) + (uso_fim.ru_stime - uso_ini.ru_stime),
+        # ru_maxrss vem em KB no Linux
+        "memoria": uso_fim.ru_maxrss / 1024,
+        "inicio": inicio_sessao,
+        "fim": fim_sessao,
+    })
+
+def _coletar(resultados, processos, n_sessoes):
+    # Espera o resultado de cada sessão; um processo que morreu sem responder não trava a coleta
+    coletados = []
+    while len(coletados) < n_sessoes:
+        try:
+            coletados.append(resultados.get(timeout=1))
+        except queue.Empty:
+            if not any(processo.is_alive() for processo in processos):
+                break
+    # Resultados enviados pouco antes de o processo terminar
+    while len(coletados) < n_sessoes:
+        try:
+            coletados.append(resultados.get(timeout=1))
+        except queue.Empty:
+            break
+    return coletados
+
+def medir_sessoes(n_sessoes, interacoes=10, semente=0, app=APP, timeout=120):
+    # Executa as sessões em processos separados, liberadas juntas depois do aquecimento,
+    # e resume as métricas
+    os.environ.setdefault("API_VENDAS_PORTA", "0")
+    os.environ.setdefault("BACKTEST_PROCESSOS", "0")
+
+    # O AppTest resolve caminhos relativos a partir deste arquivo, não do diretório atual
+    app = os.path.abspath(app)
+    contexto = multiprocessing.get_context("spawn")
+    barreira = contexto.Barrier(n_sessoes, timeout=TIMEOUT_AQUECIMENTO)
+    resultados = contexto.Queue()
+    processos = [
+        contexto.Process(target=_sessao, args=(app, interacoes, semente + i, timeout, barreira, resultados))
+        for i in range(n_sessoes)
+    ]
+    for processo in processos:
+        processo.start()
+    coletados = _coletar(resultados, processos, n_sessoes)
+    for processo in processos:
+        processo.join()
+
+    tempos = [tempo for sessao in coletados for tempo in sessao["tempos"]]
+    # Sessões que morreram sem devolver resultado: todos os seus reruns contam como erro
+    erros = sum(len(sessao["erros"]) for sessao in coletados) + (n_sessoes - len(coletados)) * (interacoes + 1)
+    medidas = [sessao for sessao in coletados if sessao["inicio"] is not None]
+    duracao = (max(s["fim"] for s in medidas) - min(s["inicio"] for s in medidas)) if medidas else np.nan
+    cpu = sum(sessao["cpu"] for sessao in coletados)
+    memorias = [sessao["memoria"] for sessao in medidas] or [np.nan]
+
+    ms = np.array(tempos or [np.nan]) * 1000
+    return {
+        "sessoes": n_sessoes,
+        "reruns": len(tempos),
+        "erros": erros,
+        "p50_ms": np.percentile(ms, 50),
+        "p90_ms": np.percentile(ms, 90),
+        "p95_ms": np.percentile(ms, 95),
+        "p99_ms": np.percentile(ms, 99),
+        "max_ms": ms.max(),
+        "reruns_por_s": len(tempos) / duracao,
+        "cpu_s": cpu,
+        "cpu_pct": cpu / duracao * 100,
+        # Soma dos picos dos processos das sessões, e o maior deles
+        "pico_memoria_mb": sum(memorias),
+        "pico_sessao_mb": max(memorias),
+    }
+
+def _formatar(valores):
+    # Colunas de largura fixa, para as linhas impressas a cada rodada ficarem alinhadas ao cabeçalho
+    larguras = [max(len(coluna), 9) for coluna in COLUNAS]
+    campos = []
+    for valor, largura in zip(valores, larguras):
+        if isinstance(valor, str):
+            campos.append(f"{valor:>{largura}}")
+        elif isinstance(valor, (int, np.integer)):
+            campos.append(f"{valor:>{largura}d}")
+        else:
+            campos.append(f"{valor:>{largura}.1f}")
+    return "  ".join(campos)
+
+def executar(lista_sessoes, interacoes=10, semente=0, app=APP, timeout=120):
+    linhas = []
+    print(_formatar(COLUNAS), flush=True)
+    for n in lista_sessoes:
+        linhas.append(medir_sessoes(n, interacoes, semente, app, timeout))
+        print(_formatar([linhas[-1][coluna] for coluna in COLUNAS]), flush=True)
+    return pd.DataFrame(linhas, columns=COLUNAS)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste de carga do dashboard de vendas")
+    parser.add_argument("--sessoes", type=int, nargs="+", default=[1, 5, 10, 25])
+    parser.add_argument("--interacoes", type=int, default=10, help="trocas de filtro por sessão")
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120, help="limite de cada rerun, em segundos")
+    parser.add_argument("--app", default=APP)
+    parser.add_argument("--csv", help="grava o resultado neste arquivo")
+    args = parser.parse_args()
+
+    resultado = executar(args.sessoes, args.interacoes, args.semente, args.app, args.timeout)
+    if args.csv:
+        resultado.to_csv(args.csv, index=False)